@@ -0,0 +1,104 @@
+import os
+import glob
+import logging
+import pandas as pd
+
+from typing import List
+from datetime import datetime
+
+# Stored tick columns, the asset is implied by the partition
+ARCHIVE_COLUMNS: List[str] = ['o', 'h', 'l', 'c', 'v']
+
+
+def to_utc_timestamp(ts: datetime) -> pd.Timestamp:
+    '''
+    Naive datetimes are taken as UTC
+    '''
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize('utc') if ts.tz is None else ts.tz_convert('utc')
+
+
+class TickArchive():
+    '''
+    Cold tier for historical ticks as monthly Parquet partitions per asset:
+
+        <root>/asset=<asset>/month=<YYYY-MM>.parquet
+
+    Each partition holds a 'date' (UTC) index and the OHLCV columns.
+    Requires pyarrow (pandas Parquet engine).
+    '''
+
+    def __init__(self, root: str, compression: str = 'zstd') -> None:
+        self.root = root
+        self.compression = compression
+
+    def partition_path(self, asset: str, month: pd.Period) -> str:
+        return os.path.join(self.root, f"asset={asset}", f"month={month.strftime('%Y-%m')}.parquet")
+
+    def months(self, asset: str) -> List[pd.Period]:
+        '''
+        Archived months for the asset in ascending order
+        '''
+        files = glob.glob(os.path.join(self.root, f"asset={asset}", "month=*.parquet"))
+        months = [pd.Period(os.path.basename(f)[len("month="):-len(".parquet")], freq='M') for f in files]
+        return sorted(months)
+
+    def write(self, asset: str, df: pd.DataFrame) -> int:
+        '''
+        Merge ticks (date indexed) into their monthly partitions.
+        Existing rows for the same date are replaced. Returns #rows written
+        '''
+        if df is None or df.empty:
+            return 0
+        df = df[ARCHIVE_COLUMNS].astype('float64')
+        df.index = pd.DatetimeIndex(df.index, name='date')
+        df.index = df.index.tz_localize('utc') if df.index.tz is None else df.index.tz_convert('utc')
+        count = 0
+        for month, part in df.groupby(df.index.tz_localize(None).to_period('M')):
+            path = self.partition_path(asset, month)
+            if os.path.exists(path):
+                part = pd.concat([pd.read_parquet(path), part])
+                part = part[~part.index.duplicated(keep='last')]
+            part = part.sort_index()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a crash never leaves a torn partition
+            tmp_path = f"{path}.tmp"
+            part.to_parquet(tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            count += len(part)
+            logging.debug(f"Archived {len(part)} ticks to {path}")
+        return count
+
+    def read(
+        self
+        , asset: str
+        , start: datetime = None
+        , end: datetime = None
+    ) -> pd.DataFrame:
+        '''
+        Archived ticks with start <= date < end. Only the partitions
+        overlapping the range are opened
+        '''
+        start = to_utc_timestamp(start) if start is not None else None
+        end = to_utc_timestamp(end) if end is not None else None
+        first = start.tz_localize(None).to_period('M') if start is not None else None
+        last = end.tz_localize(None).to_period('M') if end is not None else None
+        parts = []
+        for month in self.months(asset):
+            if (first is not None and month < first) or (last is not None and month > last):
+                continue
+            filters = []
+            if start is not None:
+                filters.append(('date', '>=', start))
+            if end is not None:
+                filters.append(('date', '<', end))
+            parts.append(pd.read_parquet(self.partition_path(asset, month), filters=filters or None))
+        if not parts:
+            df = pd.DataFrame(
+                {c: pd.Series(dtype='float64') for c in ARCHIVE_COLUMNS}
+                , index=pd.DatetimeIndex([], tz='utc', name='date')
+            )
+        else:
+            df = pd.concat(parts)
+        df['asset'] = asset
+        return df
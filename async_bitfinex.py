@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import pendulum
+import aiohttp
+
+from collections import deque
+from typing import List, Tuple, Any, AsyncIterator
+
+from bitfinex import API_URL, DEFAULT_START_DATE, RETRY_STATUS, RateLimiter
+from utils import date_range
+
+# 1000 minutes in milliseconds, one request window
+WINDOW_STEP: int = 1000*60*1000
+
+
+class TokenBucket(RateLimiter):
+    '''
+    asyncio token bucket: `rate` tokens per second up to `capacity`.
+    acquire() waits until a token is available. Share one bucket between
+    fetchers that draw on the same request budget
+    '''
+
+    async def acquire(self):
+        await asyncio.sleep(self.reserve())
+
+
+def candles_url(api_url: str, symbol: str, start_date: int, end_date: int, timeframe: str = '1m', limit: int = 1000) -> str:
+    return f'{api_url}/candles/trade:{timeframe}:t{symbol.upper()}/hist' \
+           f'?start={start_date}&end={end_date}&limit={limit}'
+
+
+async def get_candles_async(
+    session: aiohttp.ClientSession
+    , limiter: TokenBucket
+    , symbol: str
+    , start_date: int
+    , end_date: int
+    , timeframe: str = '1m'
+    , limit: int = 1000
+    , retries: int = 3
+    , backoff_factor: float = 1
+    , api_url: str = API_URL
+) -> List[Any]:
+    '''
+    One candles request under the rate limiter. 429 and 5xx responses are
+    retried with exponential backoff (or the server's Retry-After)
+    '''
+    url = candles_url(api_url, symbol, start_date, end_date, timeframe, limit)
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        async with session.get(url) as response:
+            if response.status not in RETRY_STATUS or attempt == retries:
+                response.raise_for_status()
+                return await response.json()
+            delay = float(response.headers.get('Retry-After', backoff_factor * 2 ** attempt))
+            logging.info(f"{symbol} | HTTP {response.status} for {start_date} -> {end_date}. Retry in {delay}s")
+            if response.status == 429:
+                limiter.penalize(delay)
+        await asyncio.sleep(delay)
+
+
+async def aiter_candles(
+    start_date: int = DEFAULT_START_DATE
+    , end_date: int = None
+    , symbol: str = 'btcusd'
+    , concurrency: int = 4
+    , limiter: TokenBucket = None
+    , session: aiohttp.ClientSession = None
+    , api_url: str = API_URL
+    , retries: int = 3
+) -> AsyncIterator[List[Any]]:
+    '''
+    Candles of each 1000 minute window from start_date to end_date, yielded
+    in window order while up to `concurrency` requests are in flight.
+    Stops at the first empty window, like bitfinex.iter_candles()
+    '''
+    end_date = end_date or pendulum.now().int_timestamp * 1000
+    limiter = limiter or TokenBucket.per_minute()
+    own_session = session is None
+    if own_session:
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+    windows = iter(date_range(start_date, end_date, WINDOW_STEP))
+    pending: deque = deque()
+
+    def schedule():
+        for d1, d2 in windows:
+            pending.append(((d1, d2), asyncio.ensure_future(get_candles_async(
+                session, limiter, symbol, d1, d2, retries=retries, api_url=api_url
+            ))))
+            return
+
+    try:
+        for _ in range(concurrency):
+            schedule()
+        while pending:
+            (d1, d2), task = pending.popleft()
+            candles = await task
+            if not candles:
+                logging.error(f"Failed to load candles for {d1} -> {d2}")
+                break
+            schedule()
+            logging.debug(f'{symbol} | Fetched {len(candles)} candles for {d1} -> {d2}')
+            yield candles
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*[task for _, task in pending], return_exceptions=True)
+        if own_session:
+            await session.close()
+
+
+async def load_ticks_to_now_async(
+    start_date: int = DEFAULT_START_DATE
+    , end_date: int = None
+    , symbol: str = 'btcusd'
+    , concurrency: int = 4
+    , limiter: TokenBucket = None
+    , session: aiohttp.ClientSession = None
+    , api_url: str = API_URL
+) -> Tuple[bool, List[Any]]:
+    '''
+    asyncio counterpart of bitfinex.load_ticks_to_now():
+    same (success, tick_store) result, windows fetched concurrently
+    '''
+    msg: bool = True
+    tick_store: List[Any] = []
+    try:
+        async for candles in aiter_candles(
+            start_date, end_date, symbol
+            , concurrency=concurrency, limiter=limiter, session=session, api_url=api_url
+        ):
+            tick_store.extend(candles)
+    except Exception:
+        msg = False
+        logging.exception(f"Failed to load_ticks_to_now_async() for {symbol} from {start_date} to {end_date}")
+    return msg, tick_store
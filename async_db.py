@@ -0,0 +1,316 @@
+from sqlmodel import SQLModel, select, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import selectinload
+from sqlalchemy.exc import IntegrityError
+
+from typing import List, Tuple, Any
+from datetime import datetime
+import pandas as pd
+import numpy as np
+
+import pendulum
+import logging
+
+from db import DB_CONNECT_URL, ENVIRONMENT, MANAGER_ERROR, TradeType, Asset
+from db import Tick, Timestep, Trade, Account, Position
+from db import get_connect_profile, profile_engine_args, apply_sqlite_pragmas
+from db import candles_to_rows, insert_ignore, frame_statement, rows_to_arrays, arrays_to_frame
+
+# Async drivers for the synchronous URLs in DB_CONNECT_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite"
+    , "postgresql": "postgresql+psycopg"
+}
+
+
+def to_async_url(db_url: str) -> str:
+    '''
+    Swap the driver of a connection string for its asyncio counterpart
+    '''
+    url = make_url(db_url)
+    backend = url.get_backend_name()
+    if url.drivername in ASYNC_DRIVERS.values() or backend not in ASYNC_DRIVERS:
+        return db_url
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def create_tuned_async_engine(db_url: str, profile: dict) -> AsyncEngine:
+    '''
+    Async engine with the same connection profile as create_tuned_engine()
+    '''
+    db_url = to_async_url(db_url)
+    engine = create_async_engine(db_url, **profile_engine_args(db_url, profile))
+    apply_sqlite_pragmas(engine.sync_engine, profile.get("pragmas", {}))
+    return engine
+
+
+class AsyncDBManager():
+    '''
+    asyncio counterpart of DBManager (aiosqlite for SQLite) so fetching,
+    persisting and inference can overlap in one event loop.
+    Method names, arguments and return values mirror DBManager
+    '''
+
+    def __init__(
+        self
+        , db_url: str=None
+        , environment: ENVIRONMENT=ENVIRONMENT.UNIT
+        , profile: str=None
+        , float32: bool=False
+    ) -> None:
+        if db_url:
+            self.profile = get_connect_profile(profile)
+            self.engine = create_tuned_async_engine(db_url, self.profile)
+            self.environment = db_url
+        else:
+            self.profile = get_connect_profile(profile or environment)
+            self.engine = create_tuned_async_engine(DB_CONNECT_URL[environment.value], self.profile)
+            self.environment = environment
+        # No lazy loads under asyncio: keep attributes loaded after commit
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.utc = pendulum.timezone('utc')
+        self.value_dtype = np.float32 if float32 else np.float64
+
+    def utc_convert(self, ts):
+        return self.utc.convert(ts) if ts is not None else None
+
+    def get_session(self) -> AsyncSession:
+        return self.session_factory()
+
+    async def create_schema(self):
+        '''
+        Create tables if they do not exist
+        '''
+        async with self.engine.begin() as conn:
+            await conn.run_sync(SQLModel.metadata.create_all)
+
+    async def close(self):
+        '''
+        Release all pooled connections
+        '''
+        await self.engine.dispose()
+
+    async def get_latest_timestamp(
+        self
+        , asset: Asset=Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, datetime, datetime]:
+        '''
+        Get the timestamp of the most recent tick update
+        and timestep update
+        '''
+        result: Tuple[MANAGER_ERROR, datetime, datetime] = None, None, None
+        try:
+            async with self.get_session() as session:
+                statement = select(func.max(Tick.date)).where(Tick.asset == asset)
+                last_tick: datetime = (await session.exec(statement)).first()
+                statement = select(func.max(Timestep.date)).where(Timestep.asset == asset)
+                last_timestep: datetime = (await session.exec(statement)).first()
+                result = MANAGER_ERROR.SUCCESS, self.utc_convert(last_tick), self.utc_convert(last_timestep)
+        except Exception as e:
+            result = MANAGER_ERROR.ERROR, None, None
+            logging.error(f"Failed get_latest_timestamp(): {e}")
+            logging.exception(e)
+        return result
+
+    async def add_trade(
+        self
+        , ts: datetime
+        , move: TradeType
+        , asset: Asset
+        , amount: float
+        , pct_acct: float
+        , price: float
+    ) -> Tuple[MANAGER_ERROR, Trade]:
+        '''
+        Update trade log
+        '''
+        trade: Trade = None
+        if ts is None:
+            ts = datetime.now()
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        try:
+            async with self.get_session() as session:
+                trade = Trade(date=ts, move=move, asset=asset, amount=amount, pct_acct=pct_acct, price=price)
+                session.add(trade)
+                await session.commit()
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed enter_trade(): {e}")
+            logging.exception(e)
+        return msg, trade
+
+    async def create_account(
+        self
+        , update_time: datetime
+        , cash: float
+        , asset_value: float
+        , balance: float
+        , pnl: float
+    ) -> Tuple[MANAGER_ERROR, Account]:
+        '''
+        Starting out with a fresh db, create a new account
+        '''
+        return await self.update_account_and_position(cash, asset_value, balance, pnl, update_time)
+
+    async def update_account_and_position(
+        self
+        , cash: float
+        , asset_value: float
+        , balance: float
+        , pnl: float
+        , update_time: datetime
+        , positions: List[Position]=None
+    ) -> Tuple[MANAGER_ERROR, Account]:
+        '''
+        Append a new account state and its positions in one transaction
+        '''
+        account: Account = None
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        if not update_time:
+            update_time = datetime.now()
+        try:
+            async with self.get_session() as session:
+                account = Account(
+                    date=update_time
+                    , cash=cash
+                    , asset_value=asset_value
+                    , balance=balance
+                    , pnl=pnl
+                    , positions=positions or []
+                )
+                session.add(account)
+                await session.commit()
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed update_account_and_position() {e}")
+            logging.exception(e)
+        return msg, account
+
+    async def get_account_and_position(
+        self
+    ) -> Tuple[MANAGER_ERROR, Account]:
+        '''
+        Get current account balance and position
+        '''
+        account: Account = None
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        try:
+            async with self.get_session() as session:
+                statement = (
+                    select(Account).options(selectinload(Account.positions))
+                    .order_by(Account.date.desc()).limit(1)
+                )
+                account = (await session.exec(statement)).first()
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed get_account_and_position() {e}")
+            logging.exception(e)
+        return msg, account
+
+    async def append_bitfinex_candles(
+        self
+        , asset: Asset
+        , candles: List[Any]
+    ) -> MANAGER_ERROR:
+        '''
+        Append most recent ticks
+        '''
+        msg = MANAGER_ERROR.SUCCESS
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(Tick.__table__.insert(), candles_to_rows(asset, candles))
+        except IntegrityError as ie:
+            msg = MANAGER_ERROR.DUPLICATE
+            logging.error(f"Tried to commit a duplicate record. Check timestamps. {ie.orig}")
+            logging.debug(ie)
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Error: {e}")
+            logging.exception(e)
+        return msg
+
+    async def upsert_bitfinex_candles(
+        self
+        , asset: Asset
+        , candles: List[Any]
+    ) -> Tuple[MANAGER_ERROR, int, int]:
+        '''
+        Bulk, idempotent append of raw Bitfinex candles.
+        Returns: status, #inserted, #skipped
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        inserted: int = 0
+        skipped: int = 0
+        if candles is None or not len(candles):
+            return msg, inserted, skipped
+        try:
+            rows: List[dict] = candles_to_rows(asset, candles)
+            insert = insert_ignore(self.engine.dialect.name, Tick)
+            async with self.engine.begin() as conn:
+                if self.engine.dialect.insert_executemany_returning:
+                    # As ExecutemanyBulkLoader, rowcount of an executemany is not guaranteed
+                    result = await conn.execute(insert.returning(*Tick.__table__.primary_key.columns), rows)
+                    inserted = len(result.all())
+                else:
+                    result = await conn.execute(insert, rows)
+                    inserted = max(result.rowcount, 0)
+            skipped = len(rows) - inserted
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            inserted, skipped = 0, 0
+            logging.error(f"Failed upsert_bitfinex_candles(): {e}")
+            logging.exception(e)
+        return msg, inserted, skipped
+
+    async def read_frame_arrays(
+        self
+        , model: SQLModel
+        , asset: Asset = Asset.btcusd
+        , after: datetime = None
+        , start: datetime = None
+        , limit: int = None
+        , latest: bool = False
+        , before: datetime = None
+    ) -> Tuple[MANAGER_ERROR, dict]:
+        '''
+        Columnar read, see DBManager.read_frame_arrays()
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        arrays: dict = None
+        statement, value_columns = frame_statement(
+            model, asset, after=after, start=start, limit=limit, latest=latest, before=before
+        )
+        try:
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(statement)).all()
+            arrays = rows_to_arrays(rows, value_columns, latest, self.value_dtype)
+        except Exception:
+            msg = MANAGER_ERROR.ERROR
+            logging.exception(f"Failed to read {model.__tablename__} frame for {asset}")
+        return msg, arrays
+
+    async def get_ticks_after_last_timestep(
+        self
+        , latest_timestep_ts: datetime
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        '''
+        Get ticks after the last timestep
+        '''
+        msg, arrays = await self.read_frame_arrays(Tick, asset, after=latest_timestep_ts)
+        df: pd.DataFrame = arrays_to_frame(arrays, asset) if msg == MANAGER_ERROR.SUCCESS else None
+        return msg, df
+
+    async def get_recent_timesteps(
+        self
+        , frame_length: int = 34000
+        , asset: Asset=Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        '''
+        Get frame_length latest Timesteps
+        '''
+        msg, arrays = await self.read_frame_arrays(Timestep, asset, limit=frame_length, latest=True)
+        df: pd.DataFrame = arrays_to_frame(arrays, asset) if msg == MANAGER_ERROR.SUCCESS else None
+        return msg, df
@@ -0,0 +1,88 @@
+from db import DBManager, Asset, Tick, MANAGER_ERROR
+from bitfinex import BitfinexClient, iter_candles, DEFAULT_START_DATE
+from utils import process_tick_chunks
+
+from typing import Tuple
+from datetime import datetime, timedelta
+import pandas as pd
+import pendulum
+import logging
+
+# Upper bound on rows per write, a long outage can infill far beyond one window
+MAX_ROWS_PER_WRITE: int = 10000
+
+
+def resume_point(
+    manager: DBManager
+    , asset: Asset
+    , start_date: int = None
+) -> Tuple[MANAGER_ERROR, int]:
+    '''
+    Where a backfill of the asset starts (epoch ms): its cursor, or
+    start_date if that is later. Without either, the last saved tick,
+    then DEFAULT_START_DATE
+    '''
+    msg, cursor = manager.get_backfill_cursor(asset)
+    if msg != MANAGER_ERROR.SUCCESS:
+        return msg, None
+    if cursor is not None:
+        cursor_ms = int(cursor.timestamp() * 1000)
+        return msg, max(cursor_ms, int(start_date)) if start_date else cursor_ms
+    if start_date:
+        return msg, int(start_date)
+    msg, tick = manager.get_last_tick(asset)
+    if tick is not None:
+        return msg, int(tick.to_df().index[-1].timestamp() * 1000)
+    return msg, int(DEFAULT_START_DATE)
+
+
+def backfill_ticks(
+    manager: DBManager
+    , asset: Asset = Asset.btcusd
+    , start_date: int = None
+    , end_date: int = None
+    , timeout: int = None
+    , client: BitfinexClient = None
+    , float32: bool = False
+) -> Tuple[MANAGER_ERROR, int, datetime]:
+    '''
+    Resumable streaming backfill: fetch candles window by window from the
+    resume point to end_date, infill across windows and persist each window
+    together with the asset's cursor. Memory is bounded by one window and a
+    crash or timeout resumes after the last persisted window.
+
+    Returns: status, #ticks inserted, cursor (last persisted tick date)
+    '''
+    asset = Asset(asset)
+    inserted: int = 0
+    cursor: datetime = None
+    end_date = end_date or pendulum.now().int_timestamp * 1000
+    msg, start = resume_point(manager, asset, start_date)
+    if msg != MANAGER_ERROR.SUCCESS:
+        return msg, inserted, cursor
+    # Carry the tick at the resume point so the first window is infilled to it
+    start_ts = pd.Timestamp(start, unit='ms', tz='utc')
+    msg, prev_tick = manager.read_frame(Tick, asset, before=start_ts + timedelta(milliseconds=1), limit=1, latest=True)
+    if msg != MANAGER_ERROR.SUCCESS:
+        return msg, inserted, cursor
+    logging.info(f"{asset.value} | Backfill from {start_ts} to {pd.Timestamp(end_date, unit='ms', tz='utc')}")
+    try:
+        frames = process_tick_chunks(
+            iter_candles(start, end_date, asset.value, timeout=timeout, client=client, as_array=True)
+            , asset.value
+            , prev_tick=prev_tick[['o', 'c', 'h', 'l', 'v']] if len(prev_tick) else None
+            , float32=float32
+            , max_rows=MAX_ROWS_PER_WRITE
+        )
+        for frame in frames:
+            msg, count = manager.append_ticks_with_cursor(frame, asset)
+            if msg != MANAGER_ERROR.SUCCESS:
+                break
+            inserted += count
+            cursor = frame.index[-1].to_pydatetime()
+            logging.info(f"{asset.value} | Backfilled {count} ticks up to {cursor}")
+    except Exception as e:
+        msg = MANAGER_ERROR.ERROR
+        logging.error(f"{asset.value} | Backfill interrupted at {cursor}: {e}")
+        logging.exception(e)
+    return msg, inserted, cursor
@@ -1,13 +1,19 @@
 import logging
+import os
+import threading
 import time
 import pendulum
 
-from typing import List, Tuple, Any
+from typing import List, Tuple, Dict, Any, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 import requests
+import orjson
+import numpy as np
 from utils import date_range
+from dtypes import CANDLE_DTYPE, candles_to_array
 
 '''
 logger = logging.getLogger()
@@ -22,11 +28,179 @@ API_URL = 'https://api.bitfinex.com/v2'
 
 DEFAULT_START_DATE: int = datetime(2017, 1, 1, tzinfo=timezone.utc).timestamp()*1000
 
+RETRY_STATUS: Tuple[int, ...] = (429, 500, 502, 503, 504)
+
+# (connect, read) seconds
+DEFAULT_TIMEOUT: Tuple[float, float] = (5, 30)
+
+# Bitfinex public REST candles budget: 30 requests per minute per IP
+# https://docs.bitfinex.com/reference/rest-public-candles
+BITFINEX_CANDLES_PER_MINUTE: int = 30
+
+def decode_candles(body: bytes) -> np.ndarray:
+    '''
+    Candles response body to a CANDLE_DTYPE structured array.
+    orjson parses in C and the rows go straight into float64 columns
+    instead of living on as lists of boxed numbers
+    '''
+    data = orjson.loads(body)
+    if not data:
+        return np.empty(0, dtype=CANDLE_DTYPE)
+    if not isinstance(data[0], list):
+        # e.g. ["error", 10020, "limit: invalid"]
+        raise ValueError(f"Unexpected candles response: {data}")
+    return candles_to_array(data)
+
+
+class BitfinexClient():
+    '''
+    Long lived Bitfinex REST client. One keep-alive `requests.Session`
+    (connection pool, retry policy, gzip transfer) reused by every request,
+    with connect/read timeouts on each call.
+
+    Example:
+        with BitfinexClient() as client:
+            candles = client.get_candles('btcusd', start, end)
+    '''
+
+    def __init__(
+        self
+        , api_url: str = API_URL
+        , retries: int = 3
+        , backoff_factor: float = 1
+        , status_forcelist: Tuple[int, ...] = RETRY_STATUS
+        , timeout: Tuple[float, float] = DEFAULT_TIMEOUT
+        , pool_maxsize: int = 10
+        , session: requests.Session = None
+        , adapter=None
+    ) -> None:
+        self.api_url = api_url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.session.headers.update({'Accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'})
+        retry = Retry(
+            total=retries
+            , backoff_factor=backoff_factor
+            , status_forcelist=status_forcelist
+            , allowed_methods=['GET']
+            , respect_retry_after_header=True
+        )
+        if adapter is None:
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self) -> "BitfinexClient":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def get(self, url: str) -> requests.Response:
+        return self.session.get(url, timeout=self.timeout)
+
+    def get_candles(self, symbol, start_date, end_date, timeframe='1m', limit=1000, as_array: bool = False):
+        '''
+        Return symbol candles between two dates.
+        https://docs.bitfinex.com/v2/reference#rest-public-candles
+        as_array: decode to a CANDLE_DTYPE structured array
+        '''
+        url = f'{self.api_url}/candles/trade:{timeframe}:t{symbol.upper()}/hist' \
+              f'?start={start_date}&end={end_date}&limit={limit}'
+        response = self.get(url)
+        if as_array:
+            response.raise_for_status()
+            return decode_candles(response.content)
+        return response.json()
+
+
+class RateLimiter():
+    '''
+    Thread safe token bucket: `rate` requests per second, bursts up to
+    `capacity`. acquire() blocks until a request may be sent. Threads
+    sharing a limiter share one request budget.
+    reserve() takes a token without blocking and returns the wait, so
+    async_bitfinex.TokenBucket waits on the same bucket with asyncio
+    '''
+
+    def __init__(self, rate: float, capacity: float = 1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests: int = BITFINEX_CANDLES_PER_MINUTE, burst: int = 1) -> "RateLimiter":
+        return cls(requests/60, burst)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        '''
+        Take a token, seconds until it may be used
+        '''
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens/self.rate)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    def penalize(self, seconds: float):
+        '''
+        Drain the bucket for `seconds`, e.g. after a 429
+        '''
+        with self.lock:
+            self.refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+_client: BitfinexClient = None
+_client_pid: int = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BitfinexClient:
+    '''
+    Shared client of this process. Forked workers (e.g. the pipeline
+    process pool) get their own, pooled sockets are not shared across fork
+    '''
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client, _client_pid = BitfinexClient(), os.getpid()
+        return _client
+
+
+_limiter: RateLimiter = None
+_limiter_pid: int = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    '''
+    Candles request budget shared by every caller in this process
+    (iter_candles, load_ticks_to_interval). Forked workers get their own
+    '''
+    global _limiter, _limiter_pid
+    with _client_lock:
+        if _limiter is None or _limiter_pid != os.getpid():
+            _limiter, _limiter_pid = RateLimiter.per_minute(burst=5), os.getpid()
+        return _limiter
+
+
 def requests_retry_session(
     url
     , retries=3
     , backoff_factor=1
-    , status_forcelist=(429, 500, 502, 503, 504)
+    , status_forcelist=RETRY_STATUS
     , session=None
     , adapter=None
 ):
@@ -41,34 +215,33 @@ def requests_retry_session(
         session: requests session object
 
     Example:
-        req = requests_retry_session().get(<url>)
+        req = requests_retry_session(<url>)
+
+    One-off request, prefer the pooled get_client()
     """
-    session = session or requests.Session()
-    retry = Retry(
-        total=retries
-        ,backoff_factor=backoff_factor
-        ,status_forcelist=status_forcelist
+    client = BitfinexClient(
+        retries=retries
+        , backoff_factor=backoff_factor
+        , status_forcelist=status_forcelist
+        , session=session
+        , adapter=adapter
     )
-    if adapter is None:
-        adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    return session.get(url)
+    return client.get(url)
 
 
-def get_candles(symbol, start_date, end_date, timeframe='1m', limit=1000, adapter=None):
+def get_candles(symbol, start_date, end_date, timeframe='1m', limit=1000, adapter=None, client: BitfinexClient = None, as_array: bool = False):
     """
     Return symbol candles between two dates.
     https://docs.bitfinex.com/v2/reference#rest-public-candles
+    Uses `client`, a client over `adapter`, or the shared pooled client
+    as_array: decode to a CANDLE_DTYPE structured array
     """
     # timestamps need to include milliseconds
     #start_date = start_date.int_timestamp * 1000
     #end_date = end_date.int_timestamp * 1000
-
-    url = f'{API_URL}/candles/trade:{timeframe}:t{symbol.upper()}/hist' \
-          f'?start={start_date}&end={end_date}&limit={limit}'
-    data = requests_retry_session(url, adapter=adapter).json()
-    return data
+    if client is None:
+        client = BitfinexClient(adapter=adapter) if adapter is not None else get_client()
+    return client.get_candles(symbol, start_date, end_date, timeframe=timeframe, limit=limit, as_array=as_array)
 
 
 def watchdog_timeout(timeout: int, timer_start: datetime):
@@ -76,12 +249,57 @@ def watchdog_timeout(timeout: int, timer_start: datetime):
     return timeout and timer_interval >= timeout
 
 
+def iter_candles(
+    start_date: int=DEFAULT_START_DATE
+    , end_date: int=None
+    , symbol: str='btcusd'
+    , timeout: int = None
+    , adapter=None
+    , client: BitfinexClient = None
+    , as_array: bool = False
+    , limiter: RateLimiter = None
+) -> Iterator[List[Any]]:
+    '''
+    Yield the candles of each 1000 minute window from start_date to end_date,
+    one API request at a time, so callers can process and persist as they go.
+    Requests draw on `limiter`, by default the process-wide budget.
+    Stops at the first empty window or after `timeout` seconds.
+    as_array: yield CANDLE_DTYPE structured arrays
+    '''
+    if not end_date:
+        end_date: int = pendulum.now().int_timestamp * 1000
+    if client is None and adapter is not None:
+        client = BitfinexClient(adapter=adapter)
+    limiter = limiter or get_rate_limiter()
+    # 1000 minutes in milliseconds
+    step: int = 1000*60*1000 
+    timer_start: datetime = datetime.now()
+    logging.info(f'{symbol} | Processing from {start_date}')
+    for d1, d2 in date_range(start_date, end_date, step):
+        # prevent from api rate-limiting
+        limiter.acquire()
+        logging.info(f'Fetching candles for dates: {d1} -> {d2}')
+        # returns (max) 1000 candles, one for every minute
+        candles = get_candles(symbol, d1, d2, adapter=adapter, client=client, as_array=as_array)
+        logging.debug(f'Fetched {len(candles)} candles')
+        if not len(candles):
+            # Failed to load candles so abandon for now
+            logging.error(f"Failed to load candles for {d1} -> {d2}")
+            break
+        yield candles
+        # Check for timeout
+        if watchdog_timeout(timeout, timer_start):
+            logging.info(f"Timeout {timeout} seconds reached. Quit loading ticks")
+            break
+
+
 def load_ticks_to_now(
     start_date: int=DEFAULT_START_DATE
     , end_date: int=None
     , symbol: str='btcusd'
     , timeout: int = None
     , adapter=None
+    , client: BitfinexClient = None
 ) -> Tuple[bool, dict]:
     '''
     Load the most recent ticks from Bitfinex v2 API
@@ -90,32 +308,13 @@ def load_ticks_to_now(
 
     if not end_date:
         end_date: int = pendulum.now().int_timestamp * 1000
-    # 1000 minutes in milliseconds
-    step: int = 1000*60*1000 
-    timer_start: datetime = datetime.now()
     # Accumulate ticks before returning to calling job
     tick_store: List[Any] = [] 
 
     try:
-        logging.info(f'{symbol} | Processing from {start_date}')
-        for d1, d2 in date_range(start_date, end_date, step):
-            logging.info(f'Fetching candles for dates: {d1} -> {d2}')
-            # returns (max) 1000 candles, one for every minute
-            candles = get_candles(symbol, d1, d2, adapter=adapter)
-            logging.debug(f'Fetched {len(candles)} candles')
-            if candles:
-                # Use `extend` for performance and memory efficiency
-                tick_store.extend(candles) 
-            else:
-                # Failed to load candles so abandon for now
-                logging.error(f"Failed to load candles for {d1} -> {d2}")
-                break
-            # prevent from api rate-limiting
-            time.sleep(3) 
-            # Check for timeout
-            if watchdog_timeout(timeout, timer_start):
-                logging.info(f"Timeout {timeout} seconds reached. Quit loading ticks")
-                break
+        for candles in iter_candles(start_date, end_date, symbol, timeout=timeout, adapter=adapter, client=client):
+            # Use `extend` for performance and memory efficiency
+            tick_store.extend(candles) 
     except:
         msg = False
         logging.exception(f"Failed to load_ticks() for date range: {pendulum.from_timestamp(start_date/1000)} - {pendulum.from_timestamp(end_date/1000)}")
@@ -126,24 +325,39 @@ def load_ticks_to_interval(
     d1
     , d2
     , symbols: List[str]=['btcusd']
-) -> Tuple[bool, dict]:
+    , client: BitfinexClient = None
+    , limiter: RateLimiter = None
+    , max_workers: int = 8
+) -> Tuple[Dict[str, bool], Dict[str, List[Any]]]:
     '''
-    Load the most recent ticks from Bitfinex v2 API
+    Load the candles of every symbol between d1 and d2 from Bitfinex v2 API.
+    Symbols are fetched in parallel threads under one shared rate budget,
+    a failing symbol does not abort the others.
+
+    Returns: per symbol status, per symbol candles
     '''
-    msg: bool = True
-    tick_store = {s:[] for s in symbols} # Accumulate ticks before returning to calling job
+    client = client or get_client()
+    limiter = limiter or get_rate_limiter()
+    msg: Dict[str, bool] = {s:True for s in symbols}
+    tick_store: Dict[str, List[Any]] = {s:[] for s in symbols}
 
-    try:
-        for i, symbol in enumerate(symbols, 1):
-            logging.info(f'Fetching candles for {symbol} in date range: {d1} -> {d2}')
-            # returns (max) 1000 candles, one for every minute
-            candles = get_candles(symbol, d1, d2)
-            logging.debug(f'Fetched {len(candles)} candles')
-            if candles:
-                tick_store[symbol].extend(candles)
-            time.sleep(3) # prevent from api rate-limiting
-    except:
-        msg = False
-        logging.exception(f"Failed to load_ticks() for date range: {pendulum.from_timestamp(d1/1000)} - {pendulum.from_timestamp(d2/1000)}")
-    return msg, tick_store
+    def fetch(symbol: str) -> List[Any]:
+        limiter.acquire()
+        logging.info(f'Fetching candles for {symbol} in date range: {d1} -> {d2}')
+        # returns (max) 1000 candles, one for every minute
+        return get_candles(symbol, d1, d2, client=client)
 
+    if not symbols:
+        return msg, tick_store
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(symbols))) as executor:
+        futures = {symbol: executor.submit(fetch, symbol) for symbol in symbols}
+        for symbol, future in futures.items():
+            try:
+                candles = future.result()
+                logging.debug(f'{symbol} | Fetched {len(candles)} candles')
+                if candles:
+                    tick_store[symbol].extend(candles)
+            except:
+                msg[symbol] = False
+                logging.exception(f"{symbol} | Failed to load_ticks() for date range: {pendulum.from_timestamp(d1/1000)} - {pendulum.from_timestamp(d2/1000)}")
+    return msg, tick_store
@@ -0,0 +1,123 @@
+from sqlmodel import SQLModel
+from sqlalchemy import Table, Column, MetaData, String, Enum, DateTime, Integer, select, cast, func, literal_column
+from sqlalchemy.engine import Connection
+from sqlalchemy.dialects import sqlite, postgresql
+
+from abc import ABC, abstractmethod
+from typing import List
+import enum
+import uuid
+
+# psycopg COPY type names per SQLAlchemy column type
+COPY_TYPES = [
+    (DateTime, 'timestamp')
+    , (Enum, 'text')
+    , (String, 'text')
+    , (Integer, 'int8')
+]
+
+
+def insert_ignore(dialect_name: str, model: SQLModel):
+    '''
+    Dialect specific `INSERT ... ON CONFLICT (<primary key>) DO NOTHING`
+    '''
+    dialects = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+    insert = dialects[dialect_name]
+    table = model.__table__
+    return insert(table).on_conflict_do_nothing(
+        index_elements=[c.name for c in table.primary_key.columns]
+    )
+
+
+class BulkLoader(ABC):
+    '''
+    Storage backend interface for bulk writes of Tick/Timestep rows.
+    `load` runs inside the caller's transaction, skips rows whose
+    primary key already exists and returns the number inserted
+    '''
+
+    @abstractmethod
+    def load(self, conn: Connection, model: SQLModel, rows: List[dict]) -> int:
+        ...
+
+
+class ExecutemanyBulkLoader(BulkLoader):
+    '''
+    Single `INSERT ... ON CONFLICT DO NOTHING` executemany (SQLite).
+    Inserted rows are counted from `RETURNING` where the dialect supports
+    it for executemany, otherwise the driver's rowcount is a best effort
+    '''
+
+    def load(self, conn: Connection, model: SQLModel, rows: List[dict]) -> int:
+        if not rows:
+            return 0
+        insert = insert_ignore(conn.dialect.name, model)
+        if conn.dialect.insert_executemany_returning:
+            # Skipped rows return nothing, rowcount of an executemany is not guaranteed
+            returning = insert.returning(*model.__table__.primary_key.columns)
+            return len(conn.execute(returning, rows).all())
+        result = conn.execute(insert, rows)
+        return max(result.rowcount, 0)
+
+
+class PostgresCopyBulkLoader(BulkLoader):
+    '''
+    Streams rows with binary `COPY ... FROM STDIN` into a temporary
+    staging table, then merges into the target with
+    `INSERT ... SELECT ... ON CONFLICT DO NOTHING`. Requires psycopg 3
+    '''
+
+    def copy_type(self, column: Column) -> str:
+        for column_type, copy_type in COPY_TYPES:
+            if isinstance(column.type, column_type):
+                return copy_type
+        return 'float8'
+
+    def load(self, conn: Connection, model: SQLModel, rows: List[dict]) -> int:
+        if not rows:
+            return 0
+        table = model.__table__
+        columns = [c for c in table.columns if c.name in rows[0]]
+        names = [c.name for c in columns]
+        # Enums are staged as text and cast back on merge
+        staging = Table(
+            f"staging_{table.name}_{uuid.uuid4().hex[:8]}"
+            , MetaData()
+            , *[Column(c.name, String if isinstance(c.type, Enum) else c.type) for c in columns]
+            , prefixes=['TEMPORARY']
+            , postgresql_on_commit='DROP'
+        )
+        staging.create(conn)
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            with cursor.copy(f"COPY {staging.name} ({', '.join(names)}) FROM STDIN (FORMAT BINARY)") as copy:
+                copy.set_types([self.copy_type(c) for c in columns])
+                for row in rows:
+                    copy.write_row([
+                        row[n].value if isinstance(row[n], enum.Enum) else row[n] for n in names
+                    ])
+        finally:
+            cursor.close()
+        merge = insert_ignore(conn.dialect.name, model).from_select(
+            names
+            , select(*[
+                cast(staging.c[c.name], c.type) if isinstance(c.type, Enum) else staging.c[c.name]
+                for c in columns
+            ])
+        )
+        # Count through a DML CTE, rowcount of INSERT ... SELECT is not reliable
+        inserted = merge.returning(literal_column('1')).cte(f"{staging.name}_merged")
+        return conn.execute(select(func.count()).select_from(inserted)).scalar()
+
+
+BULK_LOADERS = {
+    'sqlite': ExecutemanyBulkLoader
+    , 'postgresql': PostgresCopyBulkLoader
+}
+
+
+def get_bulk_loader(dialect_name: str) -> BulkLoader:
+    '''
+    Bulk loader for a dialect, executemany if there is no specialised one
+    '''
+    return BULK_LOADERS.get(dialect_name, ExecutemanyBulkLoader)()
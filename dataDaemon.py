@@ -1,12 +1,19 @@
-from db import DBManager, Asset, Tick, Timestep, ENVIRONMENT, MANAGER_ERROR
+from db import DBManager, Asset, Tick, Timestep, ENVIRONMENT, MANAGER_ERROR, AssetStatus
+from observations import WindowNormalizer
+from backfill import backfill_ticks
+from live import LiveIngestor
+from pipeline import STATS_HISTORY_LENGTH, state_is_current, timesteps_with_stats, run_pipeline
 from bitfinex import load_ticks_to_now
-from utils import process_ticks, compute_latest_stats, generate_timesteps_from_ticks, date_range, params, get_observation_v2, predict_via_serving
+from utils import process_ticks, date_range, params, get_observation_v2, predict_via_serving
 
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 import time
+import threading
+import asyncio
 import pendulum
 import pandas as pd
 
@@ -28,9 +35,10 @@ def job_load_ticks(scheduler: BackgroundScheduler, manager: DBManager):
     latest_tick_ts: datetime = None
     latest_timestep_ts: datetime = None
     last_tick: Tick = None
-    msg, latest_tick_ts, latest_timestep_ts = manager.get_latest_timestamp(Asset.btcusd)
-    msg2, prev_tick = manager.get_last_tick(Asset.btcusd)
-    if msg == MANAGER_ERROR.SUCCESS and msg2 == MANAGER_ERROR.SUCCESS:
+    status: Dict[Asset, AssetStatus] = {}
+    msg, status = manager.get_latest_status([Asset.btcusd])
+    latest_tick_ts, latest_timestep_ts, prev_tick = status[Asset.btcusd]
+    if msg == MANAGER_ERROR.SUCCESS and prev_tick is not None:
         prev_tick_df = prev_tick.to_df() # Needed if bitfinex ticks are incomplete
         logging.info(f"Latest Tick: {latest_tick_ts}, Latest Timestep: {latest_timestep_ts}")
         start_date: int = latest_tick_ts.timestamp() * 1000
@@ -48,7 +56,7 @@ def job_load_ticks(scheduler: BackgroundScheduler, manager: DBManager):
                 , prev_tick=prev_tick_df
             )
             logging.info(f"Persist ticks to database: {manager.engine}")
-            count = df_ticks.to_sql(name='tick', con=manager.engine, if_exists='append')
+            msg, count = manager.append_ticks(df_ticks, Asset.btcusd)
             logging.info(f"{count} ticks saved")
             if count:
                 # Only continue if ticks saved successfully
@@ -73,33 +81,42 @@ def job_generate_timesteps(
     msg, ticks = manager.get_ticks_after_last_timestep(latest_timestep_ts, Asset.btcusd)
     # Only generate timesteps if #ticks > 2 timesteps (current plus subsequent)
     if msg == MANAGER_ERROR.SUCCESS and len(ticks) >= 60:
-        # Truncate to multiples of 30 (avoid partial timesteps with less than 30 ticks)
-        # Drop the 'tail_index' ticks
-        tail_index: int = -1 * (len(ticks) % 30)
-        target_ticks = ticks if tail_index >= 0 else ticks[:tail_index]
-        logging.info("Get most recent saved Timesteps for stat generation")
-        # 34,000 is enough to recalculate the longest moving average (700 days)
-        msg, current_timesteps = manager.get_recent_timesteps(34000, Asset.btcusd)
-        if msg == MANAGER_ERROR.SUCCESS:
-            logging.info(f"Retrieved Timesteps from {current_timesteps.index[0]} to {current_timesteps.index[-1]}")
-            new_timesteps = generate_timesteps_from_ticks(target_ticks)
-            new_timesteps['asset'] = Asset.btcusd
-            logging.info(f"Created {len(new_timesteps)} timesteps from {new_timesteps.index[0]} to {new_timesteps.index[-1]}")
-            new_timesteps = compute_latest_stats(new_timesteps, current_timesteps, latest_timestep_ts)
-            logging.info(f"Persist new Timesteps")
-            count = new_timesteps[new_timesteps.index > latest_timestep_ts].to_sql(name='timestep', con=manager.engine, if_exists='append')
-            '''
-            if count:
-                logging.info("Schedule inference job")
-                scheduler.add_job(
-                    job_run_inference
-                    , 'date'
-                    , args=[scheduler, manager]
-                    , next_run_time=datetime.now()
-                )
-            '''
-            if not(count):
-                logging.error("Failed to persist new timesteps.")
+        # Incremental stats from the checkpointed indicator state if it is
+        # current, otherwise recompute from history and re-seed the state
+        history: pd.DataFrame = None
+        msg, state = manager.load_indicator_state(Asset.btcusd)
+        if not state_is_current(state, latest_timestep_ts):
+            logging.info("Get most recent saved Timesteps for stat generation")
+            msg, history = manager.get_recent_timesteps(STATS_HISTORY_LENGTH, Asset.btcusd)
+            if msg != MANAGER_ERROR.SUCCESS:
+                return
+        new_timesteps, state = timesteps_with_stats(ticks, Asset.btcusd, latest_timestep_ts, state, history)
+        logging.info(f"Persist new Timesteps")
+        msg, count = manager.append_timesteps(new_timesteps, Asset.btcusd)
+        if msg == MANAGER_ERROR.SUCCESS and count and state is not None:
+            manager.save_indicator_state(state)
+        '''
+        if count:
+            logging.info("Schedule inference job")
+            scheduler.add_job(
+                job_run_inference
+                , 'date'
+                , args=[scheduler, manager]
+                , next_run_time=datetime.now()
+            )
+        '''
+        if not(count):
+            logging.error("Failed to persist new timesteps.")
+
+
+def job_run_pipeline(manager: DBManager, executor: Executor, assets: List[Asset]):
+    '''
+    Load ticks and generate timesteps for all assets concurrently.
+    Workers fetch and compute, this process is the only DB writer
+    '''
+    logging.info(f"\t\tjob_run_pipeline() {[a.value for a in assets]}")
+    # Same 25 minute (1500 seconds) limit as job_load_ticks
+    run_pipeline(manager, executor, assets, timeout=1500)
 
 
 def run_inference(
@@ -108,12 +125,13 @@ def run_inference(
     , max_gap: timedelta
     , timesteps: pd.DataFrame
     , current_time: datetime = None
+    , normalizer: WindowNormalizer = None
 ):
     prediction = None
     latest_timestep: datetime = timesteps.index[-1].to_pydatetime()
 
     if current_time - latest_timestep < timedelta(minutes=max_gap):
-        observation = get_observation_v2(timesteps)
+        observation = get_observation_v2(timesteps, normalizer=normalizer)
         prediction = predict_via_serving(observation, endpoint=model_endpoint)
     return prediction
 
@@ -122,6 +140,7 @@ def job_run_inference(
     manager: DBManager
     , model_endpoint: str
     , max_gap: timedelta
+    , normalizer: WindowNormalizer = None
 ):
     logging.info(f"\t\t->RUN INFERENCE: {datetime.now()}")
     msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
@@ -135,6 +154,7 @@ def job_run_inference(
             , max_gap
             , timesteps
             , current_time
+            , normalizer
         )
         logging.info(f"\t\t-->EXECUTE TRADE: {current_time}, {prediction}")
 
@@ -149,34 +169,66 @@ def job_run_inference(
 @click.option('--model_endpoint', default="http://localhost:8501/v1/models/model:predict", show_default=True, help='Tensorflow Serving REST model endpoint')
 @click.option('--max_gap', default=30, type=int, show_default=True, help='Maxium lag between latest timestep and running inference (minutes)')
 @click.option('--dburl', help="Database connection string")
+@click.option('--dbprofile', help="Connection profile key (TEST/PREPROD/PROD). Defaults to --env, or DEFAULT with --dburl")
+@click.option('--timestep_cache', default=0, type=int, show_default=True, help='Size of the in-memory recent Timestep cache per asset (0 disables)')
+@click.option('--workers', default=0, type=int, show_default=True, help='Process pool size for the multi-asset pipeline (0 runs btcusd serially)')
+@click.option('--assets', default=",".join(a.value for a in Asset), show_default=True, help='Comma separated assets for the multi-asset pipeline')
+@click.option('--backfill', is_flag=True, help='Catch up --assets from their backfill cursors before scheduling')
+@click.option('--live', is_flag=True, help='Ingest --assets from the Bitfinex websocket 1m candle channels')
+@click.option('--inference', is_flag=True, help='Schedule inference 4 minutes after each --schedule run')
 #@click.option('--config', default="./config/scheduler.json", type=click.File('r'), help='Environment')
-def main(env, schedule, dburl, model_endpoint, max_gap):
+def main(env, schedule, dburl, dbprofile, timestep_cache, workers, assets, backfill, live, inference, model_endpoint, max_gap):
     manager: DBManager = None
     if dburl:
-        manager = DBManager(db_url=dburl)
+        manager = DBManager(db_url=dburl, profile=dbprofile, timestep_cache_size=timestep_cache)
     else:
-        manager = DBManager(environment=ENVIRONMENT.PREPROD)
+        manager = DBManager(environment=ENVIRONMENT(env), profile=dbprofile, timestep_cache_size=timestep_cache)
+    if backfill:
+        for asset in assets.split(','):
+            msg, count, cursor = backfill_ticks(manager, Asset(asset))
+            logging.info(f"{asset} | Backfill {msg}: {count} ticks up to {cursor}")
     scheduler = BackgroundScheduler()
+    executor: Executor = None
     # Add job to run every hour at 1 and 31 minutes past the hour
-    scheduler.add_job(
-        job_load_ticks
-        , 'cron'
-        , args=[scheduler, manager]
-        , minute=schedule
-    )
+    if workers:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        scheduler.add_job(
+            job_run_pipeline
+            , 'cron'
+            , args=[manager, executor, [Asset(a) for a in assets.split(',')]]
+            , minute=schedule
+        )
+    else:
+        scheduler.add_job(
+            job_load_ticks
+            , 'cron'
+            , args=[scheduler, manager]
+            , minute=schedule
+        )
 
-    '''
-    # Shutdown inference while testing in Juputerlab
-    scheduler.add_job(
-        job_run_inference
-        , 'cron'
-        , args=[scheduler, manager, model_endpoint, max_gap]
-        , minute=",".join([str(int(i)+4) for i in "1,31".split(',')])
-    )
-    '''
+    # Inference is off unless requested (e.g. while testing in Jupyterlab)
+    if inference:
+        # One normalizer for the process so fitted lambdas carry across runs
+        scheduler.add_job(
+            job_run_inference
+            , 'cron'
+            , args=[manager, model_endpoint, max_gap, WindowNormalizer()]
+            , minute=",".join([str((int(i)+4) % 60) for i in schedule.split(",")])
+        )
     # original intervals: '0,5,10,15,20,25,30,35,40,45,50,55'
     scheduler.start()
 
+    ingestor: LiveIngestor = None
+    live_loop: asyncio.AbstractEventLoop = None
+    live_stop: asyncio.Event = None
+    live_thread: threading.Thread = None
+    if live:
+        ingestor = LiveIngestor(manager, [Asset(a) for a in assets.split(',')])
+        live_loop = asyncio.new_event_loop()
+        live_stop = asyncio.Event()
+        live_thread = threading.Thread(target=live_loop.run_until_complete, args=(ingestor.run(live_stop),), daemon=True)
+        live_thread.start()
+
     # To keep the script running
     try:
         logging.info("===========================")
@@ -187,6 +239,13 @@ def main(env, schedule, dburl, model_endpoint, max_gap):
     except (KeyboardInterrupt, SystemExit):
         logging.error("Received an interrupt. Exiting...")
         scheduler.shutdown()
+        if executor:
+            executor.shutdown()
+        if ingestor:
+            # Let the loop flush and leave before the writer shuts down
+            live_loop.call_soon_threadsafe(live_stop.set)
+            live_thread.join(timeout=30)
+            ingestor.close()
 
 
 if __name__ == "__main__":
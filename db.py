@@ -1,14 +1,26 @@
 from sqlmodel import SQLModel, Field, create_engine, select, Session
-from sqlmodel import Column, Enum, func, Relationship, PrimaryKeyConstraint, ForeignKeyConstraint
+from sqlmodel import Column, Enum, func, Relationship, PrimaryKeyConstraint, ForeignKeyConstraint, Index
+from sqlalchemy import event, type_coerce, delete, and_, String, LargeBinary
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.orm import sessionmaker, joinedload
 from sqlalchemy.exc import IntegrityError
 
-from typing import Optional, List, Tuple, Any 
+from typing import Optional, List, Tuple, Any, Dict, NamedTuple
 from datetime import datetime, timezone
 import pandas as pd
+import numpy as np
 
 import enum
 import pendulum
 import logging
+import threading
+
+from ring_buffer import RingBuffer
+from archive import TickArchive, to_utc_timestamp
+from bulk_load import BulkLoader, get_bulk_loader, insert_ignore
+from indicators import IndicatorState
+from dtypes import Asset, ASSET_DTYPE, asset_column, CANDLE_FIELDS, CANDLE_DTYPE, candles_to_array
 
 DB_CONNECT_URL = {
     "TEST": "sqlite:///TEST.db"
@@ -17,6 +29,46 @@ DB_CONNECT_URL = {
     , "PROD": "sqlite:///PRODUCTION.db"
 }
 
+# SQLite tuning shared by the file-backed environments. The daemon, notebooks
+# and dashboard read the same file concurrently so WAL + busy_timeout lets
+# readers proceed while the daemon writes instead of failing on a lock.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL"
+    , "synchronous": "NORMAL"
+    , "cache_size": -64000 # KiB when negative, i.e. 64MB page cache
+    , "mmap_size": 268435456 # 256MB
+    , "busy_timeout": 5000 # milliseconds
+    , "temp_store": "MEMORY"
+}
+
+# Per-environment connection profile: PRAGMAs applied on every new DBAPI
+# connection and keyword arguments passed to `create_engine` (pool sizing).
+# DEFAULT is used for `--dburl` connections without an explicit profile.
+DB_CONNECT_PROFILE = {
+    "DEFAULT": {
+        "pragmas": SQLITE_PRAGMAS
+        , "engine": {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": True}
+    }
+    , "TEST": {
+        "pragmas": SQLITE_PRAGMAS
+        , "engine": {"pool_size": 2, "max_overflow": 2}
+    }
+    # In-memory database lives on a single (per-thread) connection.
+    # Pool arguments do not apply and WAL is meaningless.
+    , "UNIT": {
+        "pragmas": {"synchronous": "OFF", "temp_store": "MEMORY"}
+        , "engine": {}
+    }
+    , "PREPROD": {
+        "pragmas": SQLITE_PRAGMAS
+        , "engine": {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": True}
+    }
+    , "PROD": {
+        "pragmas": {**SQLITE_PRAGMAS, "busy_timeout": 15000}
+        , "engine": {"pool_size": 10, "max_overflow": 20, "pool_pre_ping": True, "pool_recycle": 3600}
+    }
+}
+
 class MANAGER_ERROR(int, enum.Enum):
     SUCCESS = 0
     DUPLICATE = 1
@@ -31,14 +83,53 @@ class ENVIRONMENT(str, enum.Enum):
     PROD = "PROD"
     PROD_V2 = "PROD_V2"
 
+def get_connect_profile(environment: str=None) -> dict:
+    '''
+    Connection profile for an environment key, DEFAULT if unknown
+    '''
+    key = environment.value if isinstance(environment, enum.Enum) else environment
+    return DB_CONNECT_PROFILE.get(key, DB_CONNECT_PROFILE["DEFAULT"])
+
+
+def profile_engine_args(db_url: str, profile: dict) -> dict:
+    '''
+    Engine keyword arguments of a profile.
+    Pool arguments are dropped for in-memory SQLite (single connection pool)
+    '''
+    url = make_url(db_url)
+    in_memory = url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+    return {} if in_memory else profile.get("engine", {})
+
+
+def apply_sqlite_pragmas(engine: Engine, pragmas: dict):
+    '''
+    Issue the PRAGMAs on every new DBAPI connection of a SQLite engine
+    '''
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+        cursor.close()
+
+
+def create_tuned_engine(db_url: str, profile: dict) -> Engine:
+    '''
+    Create an engine and apply the connection profile.
+    PRAGMAs are only issued against SQLite.
+    '''
+    engine = create_engine(db_url, **profile_engine_args(db_url, profile))
+    apply_sqlite_pragmas(engine, profile.get("pragmas", {}))
+    return engine
+
+
 class TradeType(int, enum.Enum):
     HOLD = 0
     BUY = 1
     SELL = 2
 
-class Asset(str, enum.Enum):
-    btcusd = "btcusd"
-    ethusd = "ethusd"
 
 class Tick(SQLModel, table=True):
     date: datetime = Field(primary_key=True, nullable=False)
@@ -51,12 +142,15 @@ class Tick(SQLModel, table=True):
 
     __table_args__ = (
         PrimaryKeyConstraint('date', 'asset'),
+        # Per-asset latest-date lookups (max(date) GROUP BY asset)
+        Index('ix_tick_asset_date', 'asset', 'date'),
     )
     
     def to_df(self):
         data = self.model_dump()
         df = pd.DataFrame({k: [data[k]] for k in data})
-        df['date'] = df['date'].apply(lambda dte: pendulum.timezone('utc').convert(dte))
+        # Naive dates are UTC. A pandas UTC index concatenates with processed ticks
+        df['date'] = pd.to_datetime(df['date'], utc=True)
         df.reset_index(drop=True, inplace=True)
         df.set_index('date', inplace=True)
         return df
@@ -76,10 +170,11 @@ class Timestep(SQLModel, table=True):
     s350: float = Field(nullable=False)
     s700: float = Field(nullable=False)
     delta: float = Field(nullable=False)
-    probability: float 
+    probability: Optional[float] = None # Set by inference after the timestep is persisted
 
     __table_args__ = (
         PrimaryKeyConstraint('date', 'asset'),
+        Index('ix_timestep_asset_date', 'asset', 'date'),
     )
 
 class Trade(SQLModel, table=True):
@@ -109,6 +204,162 @@ class Account(SQLModel, table=True):
     pnl: float = Field(nullable=False)
     positions: List["Position"] = Relationship(back_populates="account")
 
+class IndicatorCheckpoint(SQLModel, table=True):
+    '''
+    Serialized IndicatorState of an asset as of its last timestep
+    '''
+    asset: Asset = Field(primary_key=True, nullable=False)
+    date: datetime = Field(nullable=False)
+    state: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+class BackfillCursor(SQLModel, table=True):
+    '''
+    Date of the last tick a backfill persisted for an asset.
+    Written in the same transaction as the ticks so it never runs ahead
+    '''
+    asset: Asset = Field(primary_key=True, nullable=False)
+    cursor: datetime = Field(nullable=False)
+    updated: datetime = Field(nullable=False)
+
+def candles_to_rows(
+    asset: Asset
+    , candles: List[Any]
+) -> List[dict]:
+    '''
+    Candle: time in milliseconds, o, c, h, l, v
+    (or a CANDLE_DTYPE array, converted column-wise)
+    Plain parameter dicts for a Core executemany (no ORM objects)
+    '''
+    if isinstance(candles, np.ndarray):
+        dates = pd.to_datetime(candles['ts'], unit='ms').to_pydatetime()
+        return [
+            {'date': dte, 'asset': asset, 'o': o, 'c': c, 'h': h, 'l': l, 'v': v}
+            for dte, o, c, h, l, v in zip(dates, *(candles[f].tolist() for f in CANDLE_FIELDS[1:]))
+        ]
+    return [
+        {
+            'date': datetime.utcfromtimestamp(candle[0]/1000)
+            , 'asset': asset
+            , 'o': candle[1]
+            , 'c': candle[2]
+            , 'h': candle[3]
+            , 'l': candle[4]
+            , 'v': candle[5]
+        }
+        for candle in candles
+    ]
+
+
+def frame_statement(
+    model: SQLModel
+    , asset: Asset
+    , after: datetime = None
+    , start: datetime = None
+    , limit: int = None
+    , latest: bool = False
+    , before: datetime = None
+):
+    '''
+    Core select for a columnar read (see DBManager.read_frame_arrays).
+    Returns the statement and its value columns
+    '''
+    table = model.__table__
+    value_columns = [c for c in table.columns if c.name not in ('date', 'asset')]
+    # Read the date column undecoded and parse it once, vectorized
+    statement = select(type_coerce(table.c.date, String), *value_columns).where(table.c.asset == asset)
+    if after is not None:
+        statement = statement.where(table.c.date > after)
+    if start is not None:
+        statement = statement.where(table.c.date >= start)
+    if before is not None:
+        statement = statement.where(table.c.date < before)
+    statement = statement.order_by(table.c.date.desc() if latest else table.c.date.asc())
+    if limit:
+        statement = statement.limit(limit)
+    return statement, value_columns
+
+
+def rows_to_arrays(
+    rows: List[Any]
+    , value_columns: List[Any]
+    , latest: bool = False
+    , dtype: np.dtype = np.float64
+) -> dict:
+    '''
+    Transpose (date, values...) rows into int64 epoch ns dates
+    and `dtype` value arrays in ascending date order
+    '''
+    columns = list(zip(*rows)) if rows else [()] * (len(value_columns) + 1)
+    dates = pd.to_datetime(pd.Index(columns[0], dtype=object), utc=True, format='ISO8601')
+    arrays = {'date': dates.values.astype('datetime64[ns]').view(np.int64)}
+    for i, column in enumerate(value_columns, 1):
+        arrays[column.name] = np.asarray(columns[i], dtype=dtype)
+    if latest:
+        arrays = {k: v[::-1] for k, v in arrays.items()}
+    return arrays
+
+
+def ticks_to_rows(ticks: pd.DataFrame, asset: Asset) -> List[dict]:
+    '''
+    Tick rows (naive UTC dates) of a date indexed o/h/l/c/v frame
+    '''
+    asset = Asset(asset)
+    dates = pd.DatetimeIndex(ticks.index)
+    if dates.tz is not None:
+        dates = dates.tz_convert('utc').tz_localize(None)
+    rows = ticks[['o', 'h', 'l', 'c', 'v']].to_dict('records')
+    for row, dte in zip(rows, dates.to_pydatetime()):
+        row['date'] = dte
+        row['asset'] = asset
+    return rows
+
+
+def compact_frame(df: pd.DataFrame, float32: bool = False) -> pd.DataFrame:
+    '''
+    Asset column as ASSET_DTYPE and, with float32, float64 value columns
+    downcast. The date index is kept (int64 ns backed)
+    '''
+    if 'asset' in df.columns and df['asset'].dtype != ASSET_DTYPE:
+        df = df.assign(asset=df['asset'].astype(ASSET_DTYPE))
+    if float32:
+        floats = df.select_dtypes(include='float64').columns
+        df = df.astype({c: np.float32 for c in floats})
+    return df
+
+
+def arrays_to_frame(arrays: dict, asset: Asset) -> pd.DataFrame:
+    '''
+    Build a DataFrame from columnar arrays (see DBManager.read_frame_arrays)
+    without copying the value columns. The asset is an ASSET_DTYPE column
+    '''
+    index = pd.DatetimeIndex(arrays['date'].view('datetime64[ns]'), name='date').tz_localize('utc')
+    df = pd.DataFrame({k: v for k, v in arrays.items() if k != 'date'}, index=index, copy=False)
+    df['asset'] = asset_column(asset, len(df))
+    return df
+
+
+def arrays_to_timesteps(arrays: dict, asset: Asset) -> List[Timestep]:
+    '''
+    Timestep models from columnar arrays. Dates are naive UTC
+    as returned by the database
+    '''
+    dates = pd.DatetimeIndex(arrays['date'].view('datetime64[ns]')).to_pydatetime()
+    columns = [k for k in arrays if k != 'date']
+    return [
+        Timestep(date=dte, asset=asset, **{k: float(arrays[k][i]) for k in columns})
+        for i, dte in enumerate(dates)
+    ]
+
+
+class AssetStatus(NamedTuple):
+    '''
+    Bookkeeping state of one asset
+    '''
+    last_tick_ts: datetime
+    last_timestep_ts: datetime
+    last_tick: Tick
+
+
 class DBManager():
 
     def __init__(
@@ -116,17 +367,45 @@ class DBManager():
         , db_url: str=None
         , environment: ENVIRONMENT=ENVIRONMENT.UNIT
         , new_db=False
+        , profile: str=None
+        , timestep_cache_size: int=None
+        , archive: TickArchive=None
+        , bulk_loader: BulkLoader=None
+        , float32: bool=False
     ) -> None:
+        '''
+        db_url: explicit connection string, overrides `environment`
+        environment: selects the connection string and profile
+        profile: connection profile key (see DB_CONNECT_PROFILE).
+            Defaults to `environment`, or DEFAULT when `db_url` is given
+        timestep_cache_size: opt-in per-asset ring buffer of the most recent
+            Timesteps served to get_recent_timesteps()/get_latest_frame()
+        archive: optional Parquet cold tier for historical ticks
+        bulk_loader: storage backend for bulk writes.
+            Defaults to the one registered for the engine dialect
+        float32: read Tick/Timestep values as float32 instead of float64
+        '''
         if db_url:
-            self.engine = create_engine(db_url)
+            self.profile = get_connect_profile(profile)
+            self.engine = create_tuned_engine(db_url, self.profile)
             self.environment = db_url
         else:
-            self.engine = create_engine(DB_CONNECT_URL[environment.value])
+            self.profile = get_connect_profile(profile or environment)
+            self.engine = create_tuned_engine(DB_CONNECT_URL[environment.value], self.profile)
             self.environment = environment
+        self.session_factory = sessionmaker(self.engine, class_=Session)
+        self.bulk_loader = bulk_loader or get_bulk_loader(self.engine.dialect.name)
         self.utc = pendulum.timezone('utc')
         if new_db:
             self.create_schema()
         self.session = None
+        self.archive = archive
+        self.value_dtype = np.float32 if float32 else np.float64
+        self.timestep_cache_size = timestep_cache_size
+        self.timestep_cache: Dict[Asset, RingBuffer] = {}
+        self.timestep_cache_lock = threading.RLock()
+        if timestep_cache_size:
+            event.listen(self.engine, "after_execute", self.on_execute)
 
     def utc_convert(self, ts):
         return self.utc.convert(ts)
@@ -155,6 +434,45 @@ class DBManager():
             logging.exception(e)
         return result
 
+    def get_latest_status(
+        self
+        , assets: List[Asset] = None
+    ) -> Tuple[MANAGER_ERROR, Dict[Asset, AssetStatus]]:
+        '''
+        Latest tick time, latest timestep time and last tick row
+        for every asset in a single grouped query.
+        Assets without ticks map to an empty AssetStatus
+        '''
+        assets = [Asset(a) for a in (assets or list(Asset))]
+        status: Dict[Asset, AssetStatus] = {a: AssetStatus(None, None, None) for a in assets}
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        try:
+            last_ticks = (
+                select(Tick.asset, func.max(Tick.date).label('last_tick'))
+                .where(Tick.asset.in_(assets)).group_by(Tick.asset).subquery()
+            )
+            last_timesteps = (
+                select(Timestep.asset, func.max(Timestep.date).label('last_timestep'))
+                .where(Timestep.asset.in_(assets)).group_by(Timestep.asset).subquery()
+            )
+            statement = (
+                select(Tick, last_timesteps.c.last_timestep)
+                .join(last_ticks, and_(Tick.asset == last_ticks.c.asset, Tick.date == last_ticks.c.last_tick))
+                .outerjoin(last_timesteps, Tick.asset == last_timesteps.c.asset)
+            )
+            with self.get_session() as session:
+                for tick, last_timestep in session.exec(statement=statement).all():
+                    status[Asset(tick.asset)] = AssetStatus(
+                        self.utc_convert(tick.date)
+                        , self.utc_convert(last_timestep) if last_timestep else None
+                        , tick
+                    )
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed get_latest_status(): {e}")
+            logging.exception(e)
+        return msg, status
+
     def add_trade(
         self
         , ts: datetime
@@ -238,58 +556,70 @@ class DBManager():
         Dictionaries taken by dumping and modifying each model 
         using `model_dump()`
         '''
+        return self.save_account_snapshot(cash, asset_value, balance, pnl, update_time, positions)
+
+    def get_account_and_position(
+        self
+    ) -> Tuple[MANAGER_ERROR, Account]:
+        ''' 
+        Get current account balance and position
+        '''
+        return self.get_account_snapshot()
+
+    def save_account_snapshot(
+        self
+        , cash: float
+        , asset_value: float
+        , balance: float
+        , pnl: float
+        , update_time: datetime = None
+        , positions: List[Position] = None
+    ) -> Tuple[MANAGER_ERROR, Account]:
+        '''
+        Write an account row and all its positions in one transaction.
+        Positions are flushed as a single batched insert and the returned
+        Account keeps its attributes loaded (no refresh round trips)
+        '''
+        account: Account = None
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
         if not update_time:
             update_time = datetime.now()
-        
-        msg: MANAGER_ERROR
-        account: Account
-
-        msg, account = self.create_account(
-            update_time
-            , cash
-            , asset_value
-            , balance
-            , pnl
-        )
-
-        if msg == MANAGER_ERROR.SUCCESS:
-            if positions:
-                try:
-                    with self.get_session() as session:
-                        session.add(account)
-                        account.positions = positions
-                        session.commit()
-                        session.refresh(account)
-                        a = account.positions
-                        session.close()
-                except Exception as e:
-                    msg = MANAGER_ERROR.ERROR
-                    logging.error(f"Failed update_account_and_position() {e}")
-                    logging.exception(e)
+        try:
+            with self.session_factory(expire_on_commit=False) as session:
+                account = Account(
+                    date=update_time
+                    , cash=cash
+                    , asset_value=asset_value
+                    , balance=balance
+                    , pnl=pnl
+                    , positions=positions or []
+                )
+                session.add(account)
+                session.commit()
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed save_account_snapshot() {e}")
+            logging.exception(e)
         return msg, account
 
-
-    def get_account_and_position(
+    def get_account_snapshot(
         self
     ) -> Tuple[MANAGER_ERROR, Account]:
-        ''' 
-        Get current account balance and position
+        '''
+        Latest account with its positions eagerly joined in one query
         '''
         account: Account = None
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
         try:
-            with self.get_session() as session:
-                #statement = select(Account, Position).join(Account).order_by(Account.date.desc()).limit(2)
-                statement = select(Account).order_by(Account.date.desc()).limit(1)
-                account = session.exec(statement=statement).first()
-                if account:
-                    # Fetch associated positions
-                    a = account.positions
-                session.close()
+            with self.session_factory(expire_on_commit=False) as session:
+                statement = (
+                    select(Account).options(joinedload(Account.positions))
+                    .order_by(Account.date.desc()).limit(1)
+                )
+                account = session.exec(statement=statement).unique().first()
         except Exception as e:
             msg = MANAGER_ERROR.ERROR
-            logging.error(f"Failed get_account_and_position() {e}")
+            logging.error(f"Failed get_account_snapshot() {e}")
             logging.exception(e)
         return msg, account
 
@@ -304,6 +634,9 @@ class DBManager():
         '''
         frame: List[Timestep] = None
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        arrays = self.get_cached_timesteps(asset, frame_length)
+        if arrays is not None:
+            return msg, arrays_to_timesteps(arrays, asset)
         try:
             with self.get_session() as session:
                 statement = select(Timestep).where(Timestep.asset == asset).order_by(Timestep.date.desc()).limit(frame_length)
@@ -331,7 +664,7 @@ class DBManager():
                 session.commit()
                 session.close()
         except IntegrityError as ie:
-            msg = MANAGER_ERROR.Duplicate
+            msg = MANAGER_ERROR.DUPLICATE
             logging.error(f"Tried to commit a duplicate record. Check timestamps. {ie._message}, {ie._sql_message}")
             logging.debug(ie)
         except Exception as e:
@@ -347,7 +680,10 @@ class DBManager():
     ) -> Tick:
         '''
         Candle: time in milliseconds, o, c, h, l, v
+        (or a CANDLE_DTYPE array)
         '''
+        if isinstance(candles, np.ndarray):
+            return [Tick(**row) for row in candles_to_rows(asset, candles)]
         ticks: List[Tick] = []
         for candle in candles:
             tick: Tick = Tick(
@@ -387,29 +723,108 @@ class DBManager():
             logging.exception(e)
         return msg
 
-    def get_ticks_after_last_timestep(
+    def upsert_bitfinex_candles(
         self
-        , latest_timestep_ts: datetime
-        , asset: Asset = Asset.btcusd
-    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        , asset: Asset
+        , candles: List[Any]
+    ) -> Tuple[MANAGER_ERROR, int, int]:
         '''
-        Get ticks after the last timestep
+        Bulk, idempotent append of raw Bitfinex candles.
+        Candles already stored for (date, asset) are skipped instead of
+        failing the whole batch. Runs as a single bulk load in one
+        transaction.
+
+        Returns: status, #inserted, #skipped
         '''
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
-        df: pd.DataFrame = None
+        inserted: int = 0
+        skipped: int = 0
+        if candles is None or not len(candles):
+            return msg, inserted, skipped
+        try:
+            rows: List[dict] = candles_to_rows(asset, candles)
+            with self.engine.begin() as conn:
+                inserted = self.bulk_loader.load(conn, Tick, rows)
+            skipped = len(rows) - inserted
+            logging.debug(f"Upserted {inserted} candles, skipped {skipped} duplicates for {asset}")
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            inserted, skipped = 0, 0
+            logging.error(f"Failed upsert_bitfinex_candles(): {e}")
+            logging.exception(e)
+        return msg, inserted, skipped
+
+    def read_frame_arrays(
+        self
+        , model: SQLModel
+        , asset: Asset = Asset.btcusd
+        , after: datetime = None
+        , start: datetime = None
+        , limit: int = None
+        , latest: bool = False
+        , before: datetime = None
+    ) -> Tuple[MANAGER_ERROR, dict]:
+        '''
+        Columnar read of Tick or Timestep rows for one asset.
+        Bypasses ORM hydration and per-row datetime parsing.
 
+        after: only rows with date > after
+        start: only rows with date >= start
+        before: only rows with date < before
+        limit: maximum number of rows
+        latest: take the `limit` most recent rows instead of the oldest
+
+        Returns a dict of NumPy arrays in ascending date order:
+        'date' as int64 epoch nanoseconds (UTC) and every other
+        numeric column as float64 (float32 if the manager is float32)
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        arrays: dict = None
+        statement, value_columns = frame_statement(
+            model, asset, after=after, start=start, limit=limit, latest=latest, before=before
+        )
         try:
-            with self.get_session() as session:
-                statement = select(Tick).where(Tick.date > latest_timestep_ts).where(Tick.asset == asset).order_by(Tick.date.asc())
-                #ticks = session.exec(statement).all()
-                df = pd.read_sql(statement, self.engine)
-                df['date'] = df['date'].apply(lambda dte: pendulum.timezone('utc').convert(dte) )
-                df.reset_index(drop=True, inplace=True)
-                df.set_index('date', inplace=True)
-                session.close()
+            with self.engine.connect() as conn:
+                rows = conn.execute(statement).all()
+            arrays = rows_to_arrays(rows, value_columns, latest, self.value_dtype)
         except Exception:
             msg = MANAGER_ERROR.ERROR
-            logging.exception(f"Failed to get latest ticks after {latest_timestep_ts}")
+            logging.exception(f"Failed to read {model.__tablename__} frame for {asset}")
+        return msg, arrays
+
+    def read_frame(
+        self
+        , model: SQLModel
+        , asset: Asset = Asset.btcusd
+        , after: datetime = None
+        , start: datetime = None
+        , limit: int = None
+        , latest: bool = False
+        , before: datetime = None
+    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        '''
+        DataFrame over `read_frame_arrays` with a tz-aware (UTC)
+        DatetimeIndex named 'date' and the asset as a column
+        '''
+        msg, arrays = self.read_frame_arrays(
+            model, asset, after=after, start=start, limit=limit, latest=latest, before=before
+        )
+        df: pd.DataFrame = None
+        if msg == MANAGER_ERROR.SUCCESS:
+            df = arrays_to_frame(arrays, asset)
+        return msg, df
+
+    def get_ticks_after_last_timestep(
+        self
+        , latest_timestep_ts: datetime
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        '''
+        Get ticks after the last timestep
+        '''
+        msg, df = self.read_frame(Tick, asset, after=latest_timestep_ts)
+        if msg != MANAGER_ERROR.SUCCESS:
+            logging.error(f"Failed to get latest ticks after {latest_timestep_ts}")
         return msg, df
 
     def get_recent_timesteps(
@@ -420,21 +835,12 @@ class DBManager():
         '''
         Get frame_length latest Timesteps
         '''
-        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
-        df: pd.DataFrame = None
-
-        try:
-            with self.get_session() as session:
-                statement = select(Timestep).where(Timestep.asset == asset).order_by(Timestep.date.desc()).limit(frame_length)
-                df = pd.read_sql(statement, self.engine)
-                df['date'] = df['date'].apply(lambda dte: pendulum.timezone('utc').convert(dte) )
-                df.reset_index(drop=True, inplace=True)
-                df.set_index('date', inplace=True)
-                df.sort_index(inplace=True)
-                session.close()
-        except Exception:
-            msg = MANAGER_ERROR.ERROR
-            logging.exception(f"Failed to get latest {frame_length} timesteps")
+        arrays = self.get_cached_timesteps(asset, frame_length)
+        if arrays is not None:
+            return MANAGER_ERROR.SUCCESS, arrays_to_frame(arrays, asset)
+        msg, df = self.read_frame(Timestep, asset, limit=frame_length, latest=True)
+        if msg != MANAGER_ERROR.SUCCESS:
+            logging.error(f"Failed to get latest {frame_length} timesteps")
         return msg, df
 
     def get_historical_timesteps(
@@ -444,25 +850,321 @@ class DBManager():
         , asset: Asset=Asset.btcusd
     ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
         '''
-        Get frame_length latest Timesteps
+        Get frame_length Timesteps from start
+        '''
+        msg, df = self.read_frame(Timestep, asset, start=start, limit=frame_length)
+        if msg != MANAGER_ERROR.SUCCESS:
+            logging.error(f"Failed to get {frame_length} timesteps from {start}")
+        return msg, df
+
+    def append_ticks(
+        self
+        , ticks: pd.DataFrame
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, int]:
+        '''
+        Persist processed ticks (date indexed o/h/l/c/v frame) through
+        the bulk loader, skipping existing (date, asset) keys
+
+        Returns: status, #inserted
         '''
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
-        df: pd.DataFrame = None
+        inserted: int = 0
+        if ticks is None or ticks.empty:
+            return msg, inserted
+        try:
+            rows = ticks_to_rows(ticks, asset)
+            with self.engine.begin() as conn:
+                inserted = self.bulk_loader.load(conn, Tick, rows)
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            inserted = 0
+            logging.error(f"Failed append_ticks(): {e}")
+            logging.exception(e)
+        return msg, inserted
+
+    def append_timesteps(
+        self
+        , timesteps: pd.DataFrame
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, int]:
+        '''
+        Persist new Timesteps (date indexed frame) skipping existing
+        (date, asset) keys, and append them to the timestep cache.
+        Columns that are not Timestep fields are ignored.
 
+        Returns: status, #inserted
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        inserted: int = 0
+        if timesteps is None or timesteps.empty:
+            return msg, inserted
+        asset = Asset(asset)
+        columns = [
+            c.name for c in Timestep.__table__.columns
+            if c.name in timesteps.columns and c.name not in ('date', 'asset')
+        ]
+        dates = pd.DatetimeIndex(timesteps.index)
+        if dates.tz is None:
+            dates = dates.tz_localize('utc')
         try:
-            with self.get_session() as session:
-                statement = select(Timestep).where(Timestep.asset == asset).where(Timestep.date >= start).order_by(Timestep.date.asc()).limit(frame_length)
-                df = pd.read_sql(statement, self.engine)
-                df['date'] = df['date'].apply(lambda dte: pendulum.timezone('utc').convert(dte) )
-                df.reset_index(drop=True, inplace=True)
-                df.set_index('date', inplace=True)
-                df.sort_index(inplace=True)
-                session.close()
-        except Exception:
+            rows = timesteps[columns].to_dict('records')
+            for row, dte in zip(rows, dates.tz_convert('utc').tz_localize(None).to_pydatetime()):
+                row['date'] = dte
+                row['asset'] = asset
+            with self.engine.connect() as conn:
+                conn = conn.execution_options(timestep_cache_write=True)
+                with conn.begin():
+                    inserted = self.bulk_loader.load(conn, Timestep, rows)
+            with self.timestep_cache_lock:
+                buffer = self.timestep_cache.get(asset)
+                if buffer is not None:
+                    ns = dates.values.astype('datetime64[ns]').view(np.int64)
+                    # Rows after the cached tip are the inserted ones unless the
+                    # database holds rows the cache missed, then reload instead
+                    newer = ns > buffer.last_date if buffer.last_date is not None else np.ones(len(ns), dtype=bool)
+                    if newer.sum() != inserted or not np.all(np.diff(ns[newer]) > 0):
+                        self.timestep_cache.pop(asset, None)
+                    else:
+                        arrays = {'date': ns[newer]}
+                        for name in buffer.arrays:
+                            if name != 'date':
+                                arrays[name] = (
+                                    timesteps[name].to_numpy(dtype=self.value_dtype)[newer] if name in timesteps.columns
+                                    else np.full(inserted, np.nan)
+                                )
+                        buffer.extend(arrays)
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            inserted = 0
+            logging.error(f"Failed append_timesteps(): {e}")
+            logging.exception(e)
+        return msg, inserted
+
+    def get_cached_timesteps(
+        self
+        , asset: Asset
+        , frame_length: int
+    ) -> dict:
+        '''
+        Latest `frame_length` Timesteps as columnar arrays from the
+        ring buffer, without touching the database. The buffer is loaded
+        when missing; append_timesteps() keeps its tip current and other
+        in-process writes to the table drop it (see on_execute).
+        Writes from other processes are not seen, call
+        invalidate_timestep_cache() after them.
+        Returns None when the cache is disabled or too small
+        '''
+        if not self.timestep_cache_size or frame_length > self.timestep_cache_size:
+            return None
+        asset = Asset(asset)
+        with self.timestep_cache_lock:
+            buffer = self.timestep_cache.get(asset)
+            if buffer is None:
+                msg, arrays = self.read_frame_arrays(
+                    Timestep, asset, limit=self.timestep_cache_size, latest=True
+                )
+                if msg != MANAGER_ERROR.SUCCESS:
+                    return None
+                buffer = RingBuffer.from_arrays(self.timestep_cache_size, arrays)
+                self.timestep_cache[asset] = buffer
+            return buffer.last(frame_length)
+
+    def invalidate_timestep_cache(self, asset: Asset = None):
+        '''
+        Drop the cached Timesteps of one asset, or all assets
+        '''
+        with self.timestep_cache_lock:
+            if asset is None:
+                self.timestep_cache.clear()
+            else:
+                self.timestep_cache.pop(Asset(asset), None)
+
+    def on_execute(self, conn, clauseelement, multiparams, params, execution_options, result):
+        '''
+        Invalidate the timestep cache on Core/ORM INSERT, UPDATE or DELETE
+        statements against the timestep table that bypass append_timesteps(),
+        e.g. DataFrame.to_sql(con=engine). Raw SQL strings are not inspected
+        '''
+        if conn.get_execution_options().get('timestep_cache_write'):
+            return
+        if not isinstance(clauseelement, UpdateBase):
+            return
+        if getattr(clauseelement.table, 'name', None) == Timestep.__tablename__:
+            self.invalidate_timestep_cache()
+
+    def archive_ticks(
+        self
+        , before: datetime
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, int]:
+        '''
+        Move ticks of whole months before `before` from the database
+        to the Parquet archive, one month at a time. A month is only
+        deleted from the database once its partition is written.
+
+        Returns: status, #ticks moved
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        moved: int = 0
+        if self.archive is None:
+            logging.error("archive_ticks() called without an archive")
+            return MANAGER_ERROR.ERROR, moved
+        asset = Asset(asset)
+        cutoff = to_utc_timestamp(before).tz_localize(None).to_period('M').to_timestamp()
+        try:
+            with self.engine.connect() as conn:
+                first = conn.execute(select(func.min(Tick.date)).where(Tick.asset == asset)).scalar()
+            if first is None:
+                return msg, moved
+            month = pd.Timestamp(first).to_period('M').to_timestamp()
+            while month < cutoff:
+                month_end = month + pd.offsets.MonthBegin(1)
+                msg, df = self.read_frame(Tick, asset, start=month.to_pydatetime(), before=month_end.to_pydatetime())
+                if msg != MANAGER_ERROR.SUCCESS:
+                    break
+                if len(df):
+                    self.archive.write(asset.value, df)
+                    with self.engine.begin() as conn:
+                        conn.execute(
+                            delete(Tick.__table__)
+                            .where(Tick.asset == asset)
+                            .where(Tick.date >= month.to_pydatetime())
+                            .where(Tick.date < month_end.to_pydatetime())
+                        )
+                    moved += len(df)
+                    logging.info(f"Archived {len(df)} {asset.value} ticks for {month.strftime('%Y-%m')}")
+                month = month_end
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed archive_ticks(): {e}")
+            logging.exception(e)
+        return msg, moved
+
+    def get_ticks_range(
+        self
+        , start: datetime
+        , end: datetime
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, pd.DataFrame]:
+        '''
+        Ticks with start <= date < end, stitched from the Parquet
+        archive and the database. Database rows win on overlap
+        '''
+        msg, df = self.read_frame(Tick, asset, start=start, before=end)
+        if msg != MANAGER_ERROR.SUCCESS or self.archive is None:
+            return msg, df
+        try:
+            archived = self.archive.read(Asset(asset).value, start, end)
+            if len(archived):
+                archived = compact_frame(archived, float32=self.value_dtype == np.float32)
+                df = pd.concat([archived[df.columns], df])
+                df = df[~df.index.duplicated(keep='last')].sort_index()
+        except Exception as e:
             msg = MANAGER_ERROR.ERROR
-            logging.exception(f"Failed to get latest {frame_length} timesteps")
+            logging.error(f"Failed get_ticks_range(): {e}")
+            logging.exception(e)
         return msg, df
 
+    def append_ticks_with_cursor(
+        self
+        , ticks: pd.DataFrame
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, int]:
+        '''
+        append_ticks() and advance the asset's backfill cursor to the last
+        tick in one transaction, so a restart resumes after the last
+        persisted window
+
+        Returns: status, #inserted
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        inserted: int = 0
+        if ticks is None or ticks.empty:
+            return msg, inserted
+        asset = Asset(asset)
+        try:
+            rows = ticks_to_rows(ticks, asset)
+            cursor = max(row['date'] for row in rows)
+            with self.engine.begin() as conn:
+                inserted = self.bulk_loader.load(conn, Tick, rows)
+                conn.execute(delete(BackfillCursor).where(BackfillCursor.asset == asset))
+                conn.execute(BackfillCursor.__table__.insert(), [{
+                    'asset': asset, 'cursor': cursor, 'updated': datetime.utcnow()
+                }])
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            inserted = 0
+            logging.error(f"Failed append_ticks_with_cursor(): {e}")
+            logging.exception(e)
+        return msg, inserted
+
+    def get_backfill_cursor(
+        self
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, datetime]:
+        '''
+        Last tick date persisted by the asset's backfill (UTC), None if
+        it never ran
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        cursor: datetime = None
+        try:
+            with self.get_session() as session:
+                checkpoint = session.get(BackfillCursor, Asset(asset))
+                if checkpoint:
+                    cursor = self.utc_convert(checkpoint.cursor)
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed get_backfill_cursor(): {e}")
+            logging.exception(e)
+        return msg, cursor
+
+    def save_indicator_state(
+        self
+        , state: IndicatorState
+    ) -> MANAGER_ERROR:
+        '''
+        Checkpoint the indicator state of an asset (replaces the previous one)
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        if state is None:
+            logging.error("save_indicator_state() called without a state")
+            return MANAGER_ERROR.ERROR
+        try:
+            with self.get_session() as session:
+                session.merge(IndicatorCheckpoint(
+                    asset=Asset(state.asset)
+                    , date=to_utc_timestamp(state.last_date).tz_localize(None).to_pydatetime()
+                    , state=state.to_bytes()
+                ))
+                session.commit()
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed save_indicator_state(): {e}")
+            logging.exception(e)
+        return msg
+
+    def load_indicator_state(
+        self
+        , asset: Asset = Asset.btcusd
+    ) -> Tuple[MANAGER_ERROR, IndicatorState]:
+        '''
+        Restore the last checkpointed indicator state, None if there is none
+        '''
+        msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
+        state: IndicatorState = None
+        try:
+            with self.get_session() as session:
+                checkpoint = session.get(IndicatorCheckpoint, Asset(asset))
+                if checkpoint:
+                    state = IndicatorState.from_bytes(checkpoint.state)
+        except Exception as e:
+            msg = MANAGER_ERROR.ERROR
+            logging.error(f"Failed load_indicator_state(): {e}")
+            logging.exception(e)
+        return msg, state
+
     def get_last_tick(self, asset: Asset = Asset.btcusd) -> Tuple[MANAGER_ERROR, Tick]:
         msg: MANAGER_ERROR = MANAGER_ERROR.SUCCESS
         tick: Tick = None
@@ -482,11 +1184,21 @@ class DBManager():
         '''
         #SQLModel.metadata.drop_all()
         SQLModel.metadata.create_all(self.engine)
+        # create_all skips indexes of tables that already exist
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(self.engine, checkfirst=True)
 
     def get_session(self) -> Session:
         '''
-        Create a session to the chosen database if none exists or closed
+        Create a session on the pooled engine of the chosen database
         '''
         #if self.session is None or self.session.connection().closed:
         #    self.session = Session(self.engine)
-        return Session(self.engine)
+        return self.session_factory()
+
+    def close(self):
+        '''
+        Release all pooled connections
+        '''
+        self.engine.dispose()
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import enum
+
+from typing import List, Any
+
+
+class Asset(str, enum.Enum):
+    btcusd = "btcusd"
+    ethusd = "ethusd"
+
+# Frame dtype of the asset column: fixed categories so frames of
+# different assets concatenate without falling back to object
+ASSET_DTYPE = pd.CategoricalDtype([a.value for a in Asset])
+
+# Bitfinex candle layout [MTS, OPEN, CLOSE, HIGH, LOW, VOLUME] as a
+# structured array, decoded without a Python object per value
+CANDLE_FIELDS: List[str] = ['ts', 'o', 'c', 'h', 'l', 'v']
+CANDLE_DTYPE = np.dtype([('ts', np.int64)] + [(f, np.float64) for f in CANDLE_FIELDS[1:]])
+
+
+def candles_to_array(candles: Any) -> np.ndarray:
+    '''
+    Candles (lists or a CANDLE_DTYPE array) as a CANDLE_DTYPE structured array
+    '''
+    if isinstance(candles, np.ndarray) and candles.dtype == CANDLE_DTYPE:
+        return candles
+    values = np.asarray(candles, dtype=np.float64).reshape(-1, len(CANDLE_FIELDS))
+    array = np.empty(len(values), dtype=CANDLE_DTYPE)
+    for i, field in enumerate(CANDLE_FIELDS):
+        array[field] = values[:, i]
+    return array
+
+
+def asset_column(asset: Asset, length: int) -> pd.Categorical:
+    '''
+    A column of one asset as ASSET_DTYPE codes (one byte per row)
+    '''
+    code = ASSET_DTYPE.categories.get_loc(Asset(asset).value)
+    return pd.Categorical.from_codes(np.full(length, code, dtype=np.int8), dtype=ASSET_DTYPE)
@@ -0,0 +1,212 @@
+import io
+import json
+import math
+import numpy as np
+import pandas as pd
+
+from typing import Iterable, Dict
+
+
+class RollingMoments():
+    '''
+    Constant time rolling mean/sample stdev over the last `window` values.
+    Keeps running sums of the values (shifted by the first value seen, to
+    avoid cancellation on large prices) and their squares over a circular
+    buffer. Sums are recomputed exactly once per `window` pushes so
+    floating point drift stays bounded.
+    '''
+
+    def __init__(self, window: int, values: Iterable[float] = None) -> None:
+        self.window = window
+        self.buffer = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+        self.shift: float = None
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.pushes = 0
+        for value in values if values is not None else []:
+            self.push(value)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def push(self, value: float):
+        '''
+        Append a value, dropping the oldest once the window is full
+        '''
+        if self.shift is None:
+            self.shift = float(value)
+        d = float(value) - self.shift
+        if self.count == self.window:
+            old = self.buffer[self.pos]
+            self.sum -= old
+            self.sumsq -= old * old
+        else:
+            self.count += 1
+        self.buffer[self.pos] = d
+        self.sum += d
+        self.sumsq += d * d
+        self.pos = (self.pos + 1) % self.window
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            self.recompute()
+
+    def recompute(self):
+        values = self.buffer[:self.count] if self.count < self.window else self.buffer
+        self.sum = float(values.sum())
+        self.sumsq = float((values * values).sum())
+
+    def moments(self, s: float, ss: float, n: int):
+        if n < 2:
+            return self.shift + s/n if n else math.nan, math.nan
+        variance = (ss - s * s/n)/(n - 1)
+        return self.shift + s/n, math.sqrt(max(variance, 0.0))
+
+    @property
+    def mean(self) -> float:
+        return self.moments(self.sum, self.sumsq, self.count)[0]
+
+    @property
+    def std(self) -> float:
+        '''
+        Sample (ddof=1) standard deviation, as statistics.stdev
+        '''
+        return self.moments(self.sum, self.sumsq, self.count)[1]
+
+    def peek_std(self, value: float) -> float:
+        '''
+        Sample stdev as if `value` were pushed, without changing the state
+        '''
+        if self.shift is None:
+            return math.nan
+        d = float(value) - self.shift
+        s, ss, n = self.sum + d, self.sumsq + d * d, self.count
+        if self.count == self.window:
+            old = self.buffer[self.pos]
+            s, ss = s - old, ss - old * old
+        else:
+            n += 1
+        return self.moments(s, ss, n)[1]
+
+
+class IndicatorState():
+    '''
+    Incremental indicator state of one asset so new timesteps can be
+    computed without reloading the timestep history:
+        - one circular buffer of the last max(N) closes shared by all SMAs
+        - the current value of every SMA in `sma_list`
+        - a RollingMoments per volatility window in `vol_list`
+        - the last close (delta) and the date of the last timestep
+    Updates follow the same recurrences as utils.streaming_stats.
+    Serialized with to_bytes()/from_bytes() for database checkpoints.
+    '''
+
+    def __init__(
+        self
+        , asset: str
+        , sma_list: Dict[str, int]
+        , vol_list: Dict[str, int]
+    ) -> None:
+        self.asset = asset
+        self.sma_list = dict(sma_list)
+        self.vol_list = dict(vol_list)
+        self.capacity = max(list(self.sma_list.values()) + list(self.vol_list.values()))
+        self.closes = np.zeros(self.capacity, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+        self.means: Dict[str, float] = {k: math.nan for k in self.sma_list}
+        self.vols: Dict[str, RollingMoments] = {k: RollingMoments(N) for k, N in self.vol_list.items()}
+        self.last_date: pd.Timestamp = None
+
+    @classmethod
+    def from_timesteps(
+        cls
+        , asset: str
+        , timesteps: pd.DataFrame
+        , sma_list: Dict[str, int]
+        , vol_list: Dict[str, int]
+    ) -> "IndicatorState":
+        '''
+        Seed from the tail of a date indexed timestep frame with
+        a 'c' column and the current SMA columns
+        '''
+        state = cls(asset, sma_list, vol_list)
+        state.set_closes(timesteps['c'].to_numpy(dtype=np.float64))
+        last = timesteps.iloc[-1]
+        state.means = {k: float(last[k]) for k in state.sma_list}
+        state.last_date = pd.Timestamp(timesteps.index[-1])
+        return state
+
+    def set_closes(self, closes: np.ndarray):
+        '''
+        Reset the close buffer and volatility windows from a close history
+        '''
+        closes = np.asarray(closes, dtype=np.float64)[-self.capacity:]
+        self.count = len(closes)
+        self.closes[:self.count] = closes
+        self.pos = self.count % self.capacity
+        self.vols = {k: RollingMoments(N, closes[-N:]) for k, N in self.vol_list.items()}
+
+    def push_close(self, c: float):
+        self.closes[self.pos] = c
+        self.pos = (self.pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def close_back(self, N: int) -> float:
+        '''
+        The close N timesteps back (N=1 is the last close)
+        '''
+        if N > self.count:
+            raise IndexError(f"Need {N} closes of history. Have {self.count}")
+        return self.closes[(self.pos - N) % self.capacity]
+
+    def update(self, c_n: float) -> Dict[str, float]:
+        '''
+        Stats of a new close and advance the state
+        '''
+        results = {}
+        for sma_key, N in self.sma_list.items():
+            self.means[sma_key] = self.means[sma_key] + (c_n - self.close_back(N))/N
+            results[sma_key] = self.means[sma_key]
+        for vol_key, state in self.vols.items():
+            results[vol_key] = state.peek_std(c_n)
+            state.push(c_n)
+        c_prev = self.close_back(1)
+        results['delta'] = (c_n - c_prev)/c_prev
+        self.push_close(c_n)
+        return results
+
+    def update_frame(self, new_timesteps: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Stats for the rows of `new_timesteps` after the last timestep,
+        returned with the stat columns added
+        '''
+        new_rows = new_timesteps[new_timesteps.index > self.last_date]
+        stats = [self.update(c) for c in new_rows['c'].to_numpy(dtype=np.float64)]
+        if len(new_rows):
+            self.last_date = pd.Timestamp(new_rows.index[-1])
+        return new_rows.assign(**pd.DataFrame(stats, index=new_rows.index))
+
+    def to_bytes(self) -> bytes:
+        ordered = np.roll(self.closes, -self.pos)[self.capacity - self.count:]
+        meta = {
+            'asset': self.asset
+            , 'sma_list': self.sma_list
+            , 'vol_list': self.vol_list
+            , 'means': self.means
+            , 'last_date': self.last_date.isoformat() if self.last_date is not None else None
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, closes=ordered, meta=np.array(json.dumps(meta)))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "IndicatorState":
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        meta = json.loads(str(arrays['meta']))
+        state = cls(meta['asset'], meta['sma_list'], meta['vol_list'])
+        state.set_closes(arrays['closes'])
+        state.means = meta['means']
+        state.last_date = pd.Timestamp(meta['last_date']) if meta['last_date'] else None
+        return state
@@ -0,0 +1,204 @@
+from db import DBManager, Asset, Tick, MANAGER_ERROR
+from bitfinex import BitfinexClient
+from backfill import backfill_ticks
+from utils import process_ticks
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+import pandas as pd
+import asyncio
+import json
+import logging
+import websockets
+
+BITFINEX_WS_URL = 'wss://api-pub.bitfinex.com/ws/2'
+
+
+def candle_key(asset: Asset, timeframe: str = '1m') -> str:
+    '''
+    Candles channel key, e.g. trade:1m:tBTCUSD
+    '''
+    return f"trade:{timeframe}:t{Asset(asset).value.upper()}"
+
+
+class CandleBatcher():
+    '''
+    Streamed candles per asset until they are written. Updates of the same
+    minute replace each other; a minute is final once a later one was seen
+    '''
+
+    def __init__(self) -> None:
+        self.pending: Dict[Asset, Dict[int, List[Any]]] = {}
+
+    def add(self, asset: Asset, candle: List[Any]):
+        self.pending.setdefault(asset, {})[int(candle[0])] = candle
+
+    def final(self, asset: Asset) -> List[List[Any]]:
+        '''
+        Pop the closed candles of the asset in ascending time
+        '''
+        candles = self.pending.get(asset, {})
+        if len(candles) < 2:
+            return []
+        forming = max(candles)
+        closed = sorted(mts for mts in candles if mts < forming)
+        return [candles.pop(mts) for mts in closed]
+
+
+class LiveIngestor():
+    '''
+    Long running Bitfinex v2 websocket ingestion of 1m candles for `assets`
+    (all assets by default).
+    Closed candles are batched and written every `flush_interval` seconds
+    (infilled, with the backfill cursor) by a single writer thread.
+    On every (re)connect the gap since the last persisted tick is first
+    filled from REST with backfill_ticks()
+    '''
+
+    def __init__(
+        self
+        , manager: DBManager
+        , assets: List[Asset] = None
+        , url: str = BITFINEX_WS_URL
+        , flush_interval: float = 5
+        , reconnect_delay: float = 5
+        , gap_fill: bool = True
+        , client: BitfinexClient = None
+    ) -> None:
+        self.manager = manager
+        self.assets = list(Asset) if assets is None else [Asset(a) for a in assets]
+        self.url = url
+        self.flush_interval = flush_interval
+        self.reconnect_delay = reconnect_delay
+        self.gap_fill_enabled = gap_fill
+        self.client = client
+        self.batcher = CandleBatcher()
+        self.channels: Dict[int, Asset] = {}
+        self.prev_ticks: Dict[Asset, pd.DataFrame] = {}
+        # Single writer, DB and REST work stays off the event loop
+        self.writer = ThreadPoolExecutor(max_workers=1)
+
+    async def in_writer(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.writer, fn, *args)
+
+    def load_prev_tick(self, asset: Asset):
+        msg, prev_tick = self.manager.read_frame(Tick, asset, limit=1, latest=True)
+        if msg == MANAGER_ERROR.SUCCESS:
+            self.prev_ticks[asset] = prev_tick[['o', 'c', 'h', 'l', 'v']] if len(prev_tick) else None
+
+    def fill_gap(self, asset: Asset):
+        '''
+        REST backfill from the last persisted tick, skipped for an asset
+        with no ticks at all (run a full backfill for that)
+        '''
+        self.load_prev_tick(asset)
+        if self.prev_ticks.get(asset) is None:
+            logging.info(f"{asset.value} | No saved ticks, skip gap fill")
+            return
+        msg, count, cursor = backfill_ticks(self.manager, asset, client=self.client)
+        logging.info(f"{asset.value} | Gap fill {msg}: {count} ticks up to {cursor}")
+        self.load_prev_tick(asset)
+
+    def persist(self, asset: Asset, candles: List[List[Any]]) -> int:
+        '''
+        Infill and write closed candles after the last persisted tick
+        '''
+        prev_tick = self.prev_ticks.get(asset)
+        if prev_tick is not None:
+            last_ts = prev_tick.index[-1].value // 10**6
+            candles = [c for c in candles if c[0] > last_ts]
+        if not candles:
+            return 0
+        ticks = process_ticks(candles, asset.value, prev_tick)
+        msg, count = self.manager.append_ticks_with_cursor(ticks, asset)
+        if msg == MANAGER_ERROR.SUCCESS:
+            self.prev_ticks[asset] = ticks.iloc[-1:][['o', 'c', 'h', 'l', 'v']]
+        return count
+
+    async def flush(self):
+        for asset in self.assets:
+            candles = self.batcher.final(asset)
+            if candles:
+                count = await self.in_writer(self.persist, asset, candles)
+                logging.debug(f"{asset.value} | Wrote {count} live ticks")
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def handle(self, message: Any):
+        '''
+        Bitfinex v2 messages: events (dict), heartbeats [chanId, "hb"],
+        snapshots [chanId, [[candle], ...]] and updates [chanId, [candle]]
+        '''
+        if isinstance(message, dict):
+            if message.get('event') == 'subscribed':
+                key = message['key']
+                asset = next((a for a in self.assets if candle_key(a) == key), None)
+                if asset is None:
+                    logging.error(f"Subscribed to unexpected channel {key}")
+                    return
+                self.channels[message['chanId']] = asset
+                logging.info(f"Subscribed to {key}")
+            elif message.get('event') == 'error':
+                logging.error(f"Websocket error: {message}")
+            return
+        chan_id, payload = message[0], message[1]
+        asset = self.channels.get(chan_id)
+        if asset is None or payload == 'hb' or not isinstance(payload, list) or not payload:
+            return
+        candles = payload if isinstance(payload[0], list) else [payload]
+        for candle in candles:
+            self.batcher.add(asset, candle)
+
+    async def session(self, ws):
+        if self.gap_fill_enabled:
+            for asset in self.assets:
+                await self.in_writer(self.fill_gap, asset)
+        else:
+            for asset in self.assets:
+                await self.in_writer(self.load_prev_tick, asset)
+        self.channels = {}
+        for asset in self.assets:
+            await ws.send(json.dumps({'event': 'subscribe', 'channel': 'candles', 'key': candle_key(asset)}))
+        flusher = asyncio.ensure_future(self.flush_periodically())
+        try:
+            async for message in ws:
+                self.handle(json.loads(message))
+        finally:
+            flusher.cancel()
+            await self.flush()
+
+    async def run(self, stop: asyncio.Event = None):
+        '''
+        Ingest until `stop` is set, reconnecting after disconnects
+        '''
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            try:
+                async with websockets.connect(self.url) as ws:
+                    session = asyncio.ensure_future(self.session(ws))
+                    stopper = asyncio.ensure_future(stop.wait())
+                    await asyncio.wait([session, stopper], return_when=asyncio.FIRST_COMPLETED)
+                    stopper.cancel()
+                    if not session.done():
+                        session.cancel()
+                    await asyncio.gather(session, return_exceptions=True)
+                    if not session.cancelled() and session.exception():
+                        raise session.exception()
+            except (websockets.ConnectionClosed, OSError) as e:
+                logging.error(f"Websocket disconnected: {e}")
+            except Exception as e:
+                # Keep ingesting, a bad frame or write must not end the loop
+                logging.error(f"Live ingestion failed: {e}")
+                logging.exception(e)
+            if not stop.is_set():
+                logging.info(f"Reconnect in {self.reconnect_delay}s")
+                try:
+                    await asyncio.wait_for(stop.wait(), self.reconnect_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    def close(self):
+        self.writer.shutdown(wait=True)
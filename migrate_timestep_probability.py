@@ -0,0 +1,98 @@
+'''
+One-off migration: make timestep.probability nullable.
+
+Databases created before Timestep.probability became Optional keep the
+column NOT NULL, create_all() does not alter existing tables. Stop the
+daemon, then run once per database:
+
+    python migrate_timestep_probability.py --dburl sqlite:///PRODUCTION.db
+
+SQLite cannot alter a column: the file is copied to --backup first, then the
+table is rebuilt and its indexes recreated. PostgreSQL drops the constraint in
+place (take a pg_dump beforehand). A database that is already migrated is
+left untouched.
+'''
+import os
+import sqlite3
+import logging
+import click
+
+from sqlalchemy import create_engine, inspect, text, MetaData
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+
+from db import Timestep
+
+
+def probability_is_nullable(engine: Engine) -> bool:
+    inspector = inspect(engine)
+    if not inspector.has_table(Timestep.__tablename__):
+        raise ValueError(f"No {Timestep.__tablename__} table in {engine.url}")
+    columns = {c['name']: c['nullable'] for c in inspector.get_columns(Timestep.__tablename__)}
+    if 'probability' not in columns:
+        raise ValueError(f"No probability column in {Timestep.__tablename__}")
+    return columns['probability']
+
+
+def backup_sqlite(engine: Engine, path: str) -> None:
+    '''
+    Online copy of the whole database file with the sqlite3 backup API
+    '''
+    if os.path.exists(path):
+        raise FileExistsError(f"Backup {path} already exists")
+    target = sqlite3.connect(path)
+    try:
+        with engine.connect() as conn:
+            conn.connection.driver_connection.backup(target)
+    finally:
+        target.close()
+
+
+def migrate(engine: Engine, backup: str = None) -> bool:
+    '''
+    Drop NOT NULL from timestep.probability, True if the schema changed
+    '''
+    if probability_is_nullable(engine):
+        logging.info(f"{Timestep.__tablename__}.probability is already nullable")
+        return False
+
+    table = Timestep.__table__
+    if engine.dialect.name != 'sqlite':
+        with engine.begin() as conn:
+            conn.execute(text(f'ALTER TABLE "{table.name}" ALTER COLUMN "probability" DROP NOT NULL'))
+        return True
+
+    if backup:
+        backup_sqlite(engine, backup)
+        logging.info(f"Backed up {engine.url.database} to {backup}")
+    with engine.begin() as conn:
+        existing = [c['name'] for c in inspect(conn).get_columns(table.name)]
+        columns = ', '.join(f'"{c}"' for c in existing if c in table.columns)
+        rebuilt = table.to_metadata(MetaData(), name=f"_{table.name}_rebuild")
+        conn.execute(CreateTable(rebuilt))
+        conn.execute(text(f'INSERT INTO "{rebuilt.name}" ({columns}) SELECT {columns} FROM "{table.name}"'))
+        conn.execute(text(f'DROP TABLE "{table.name}"'))
+        conn.execute(text(f'ALTER TABLE "{rebuilt.name}" RENAME TO "{table.name}"'))
+        # The indexes went with the old table
+        for index in table.indexes:
+            index.create(conn)
+    return True
+
+
+@click.command()
+@click.option('--dburl', required=True, help="Database connection string")
+@click.option('--backup', help="SQLite backup file. Defaults to <database>.bak")
+def main(dburl, backup):
+    engine = create_engine(dburl)
+    try:
+        if engine.dialect.name == 'sqlite':
+            backup = backup or f"{engine.url.database}.bak"
+        if migrate(engine, backup):
+            logging.info(f"{Timestep.__tablename__}.probability is now nullable")
+    finally:
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,231 @@
+import numpy as np
+import pandas as pd
+
+from scipy import stats, optimize
+from numpy.lib.stride_tricks import sliding_window_view
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from typing import List, Tuple, Any
+
+from hyperparameters import Params
+
+params: Params = Params()
+
+# Column order of get_observation_v2(): co-normalized fields, then volume
+GROUP_FIELDS: List[str] = [f for f in params.target_fields if f != 'v']
+OBSERVATION_FIELDS: List[str] = GROUP_FIELDS + ['v']
+
+# 'power': Yeo-Johnson + standardize as PowerTransformer
+# 'standard': closed-form z-score only (lambda fixed at 1, the identity)
+NORMALIZER_MODES: List[str] = ['power', 'standard']
+
+
+def is_constant(x: np.ndarray) -> bool:
+    '''
+    Same test PowerTransformer uses to leave a feature untransformed
+    '''
+    eps = np.finfo(np.float64).eps
+    n, mean, var = x.size, np.mean(x), np.var(x)
+    return var <= n * eps * var + (n * mean * eps) ** 2
+
+
+def yeo_johnson_bounds(x: np.ndarray) -> Tuple[float, float]:
+    '''
+    Overflow-safe lambda range scipy's yeojohnson_normmax() searches.
+    scipy does not expose it, this mirrors the pinned scipy release
+    '''
+    log1p_max_x = np.log1p(20 * np.max(np.abs(x)))
+    log_eps = np.log(np.finfo(np.float64).eps)
+    lb = (np.log(np.finfo(np.float64).tiny) - log_eps) / 2 / log1p_max_x
+    ub = (np.log(np.finfo(np.float64).max) + log_eps) / 2 / log1p_max_x
+    if np.all(x < 0):
+        lb, ub = 2 - ub, 2 - lb
+    elif np.any(x < 0):
+        lb, ub = max(2 - ub, lb), min(2 - lb, ub)
+    return lb, ub
+
+
+def neg_yeo_johnson_llf(lmbda: float, x: np.ndarray) -> float:
+    llf = stats.yeojohnson_llf(lmbda, x)
+    return np.inf if np.isinf(llf) else -llf
+
+
+def is_well_conditioned(x: np.ndarray, lmbda: float) -> bool:
+    '''
+    The transformed values keep about a third of the float64 digits. Below
+    that the likelihood is mostly rounding noise and only the cold search
+    reproduces PowerTransformer's lambda
+    '''
+    with np.errstate(all='ignore'):
+        y = stats.yeojohnson(x, lmbda)
+        return bool(np.all(np.isfinite(y)) and np.std(y) > np.cbrt(np.finfo(np.float64).eps) * np.abs(np.mean(y)))
+
+
+def yeo_johnson_lambda(x: np.ndarray, start: float = None, width: float = 0.05) -> float:
+    '''
+    Maximum likelihood Yeo-Johnson lambda of the flattened values,
+    as PowerTransformer().fit(). With `start`, the same bounded search
+    runs on start +/- width (clamped to scipy's range). It falls back to
+    the full range if the optimum lies on a narrowed edge or the window
+    is ill-conditioned at it
+    '''
+    x = np.ravel(x).astype(np.float64)
+    if is_constant(x):
+        return 1.0
+    if start is None or not np.isfinite(start):
+        return float(stats.yeojohnson_normmax(x))
+    lb, ub = yeo_johnson_bounds(x)
+    low, high = max(lb, start - width), min(ub, start + width)
+    if low < high:
+        # Match scipy's xtol, see yeojohnson_normmax()
+        lmbda = optimize.fminbound(neg_yeo_johnson_llf, low, high, args=(x,), xtol=1.48e-08)
+        edge = 1e-6 * max(1.0, abs(lmbda))
+        inside = (low == lb or lmbda - low > edge) and (high == ub or high - lmbda > edge)
+        if inside and is_well_conditioned(x, lmbda):
+            return float(lmbda)
+    return float(stats.yeojohnson_normmax(x))
+
+
+def yeo_johnson(x: np.ndarray, lmbda: np.ndarray) -> np.ndarray:
+    '''
+    Yeo-Johnson transform with `lmbda` broadcast against `x`
+    (e.g. one lambda per window), as scipy.stats.yeojohnson
+    '''
+    lmbda = np.broadcast_to(lmbda, x.shape)
+    eps = np.finfo(np.float64).eps
+    pos = x >= 0
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        log_pos = np.log1p(np.where(pos, x, 0))
+        log_neg = np.log1p(np.where(pos, 0, -x))
+        out_pos = np.where(np.abs(lmbda) < eps, log_pos, np.expm1(lmbda * log_pos)/lmbda)
+        out_neg = np.where(
+            np.abs(lmbda - 2) > eps
+            , -np.expm1((2 - lmbda) * log_neg)/(2 - lmbda)
+            , -log_neg
+        )
+    return np.where(pos, out_pos, out_neg)
+
+
+def standardize(x: np.ndarray, axis) -> np.ndarray:
+    '''
+    Zero mean, unit variance along `axis`, as StandardScaler
+    (a zero scale is left at 1)
+    '''
+    mean = x.mean(axis=axis, keepdims=True)
+    scale = x.std(axis=axis, keepdims=True)
+    scale[scale < 10 * np.finfo(np.float64).eps] = 1.0
+    return (x - mean)/scale
+
+
+def normalize_windows(windows: np.ndarray, lambdas: np.ndarray) -> np.ndarray:
+    '''
+    Transform and standardize (n, L, F) windows in OBSERVATION_FIELDS order
+    with their (n, 2) group/volume lambdas
+    '''
+    group = standardize(yeo_johnson(windows[..., :-1], lambdas[:, 0, None, None]), axis=(1, 2))
+    v = standardize(yeo_johnson(windows[..., -1], lambdas[:, 1, None]), axis=1)
+    return np.concatenate([group, v[..., None]], axis=-1)
+
+
+def window_lambdas(windows: np.ndarray) -> np.ndarray:
+    '''
+    (group, volume) lambdas of each (L, F) window in OBSERVATION_FIELDS order
+    '''
+    return np.array(
+        [[yeo_johnson_lambda(w[:, :-1]), yeo_johnson_lambda(w[:, -1])] for w in windows]
+        , dtype=np.float64
+    ).reshape(-1, 2)
+
+
+def fit_window_lambdas(windows: np.ndarray, n_jobs: int = None, chunk_size: int = 256) -> np.ndarray:
+    '''
+    Lambdas of every window, fitted across `n_jobs` processes
+    (in process if n_jobs is None)
+    '''
+    chunks = [windows[i:i + chunk_size] for i in range(0, len(windows), chunk_size)]
+    if not n_jobs or len(chunks) < 2:
+        results = [window_lambdas(c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(window_lambdas, chunks))
+    return np.concatenate(results) if results else np.empty((0, 2))
+
+
+def get_observations(
+    timesteps: pd.DataFrame
+    , step: int = 1
+    , n_jobs: int = None
+    , batch_size: int = 512
+    , mode: str = 'power'
+) -> np.ndarray:
+    '''
+    Observations of every `step`-th window of a timestep frame as one
+    (N, *params.observation_shape) float32 tensor. Observation k covers
+    rows [k*step, k*step + observation_size) and matches get_observation_v2()
+    of that slice. Windows are strided views of the frame, only the
+    lambda fit runs per window
+    '''
+    L = params.observation_size
+    values = timesteps[OBSERVATION_FIELDS].to_numpy(dtype=np.float64)
+    if len(values) < L:
+        return np.empty((0,) + params.observation_shape, dtype=np.float32)
+    # (N, L, F) view, no copy
+    windows = sliding_window_view(values, L, axis=0)[::step].transpose(0, 2, 1)
+    if mode == 'standard':
+        lambdas = np.ones((len(windows), 2))
+    else:
+        lambdas = fit_window_lambdas(windows, n_jobs=n_jobs)
+    observations = np.empty((len(windows),) + params.observation_shape, dtype=np.float32)
+    for start in range(0, len(windows), batch_size):
+        batch = windows[start:start + batch_size]
+        scaled = normalize_windows(batch, lambdas[start:start + batch_size])
+        observations[start:start + len(batch)] = scaled.reshape((len(batch),) + params.observation_shape)
+    return observations
+
+
+class WindowNormalizer():
+    '''
+    get_observation_v2() normalization for a stream of overlapping windows.
+    Fitted lambdas are cached per (asset, window end, window length) so a
+    repeated window is never refitted, and a new window warm-starts the
+    optimizer from the asset's previous lambdas (consecutive windows share
+    all but one row). mode='standard' skips the fit altogether.
+    '''
+
+    def __init__(self, mode: str = 'power', cache_size: int = 1024, width: float = 0.05) -> None:
+        if mode not in NORMALIZER_MODES:
+            raise ValueError(f"Unknown normalizer mode {mode}. Expected one of {NORMALIZER_MODES}")
+        self.mode = mode
+        self.cache_size = cache_size
+        self.width = width
+        self.cache: OrderedDict = OrderedDict()
+        self.previous: dict = {}
+
+    def lambdas(self, asset: str, key: Tuple[Any, int], window: np.ndarray) -> np.ndarray:
+        '''
+        (group, volume) lambdas of an (L, F) window
+        '''
+        if self.mode == 'standard':
+            return np.ones(2)
+        if (asset, key) in self.cache:
+            self.cache.move_to_end((asset, key))
+            return self.cache[(asset, key)]
+        start = self.previous.get(asset, (None, None))
+        lambdas = np.array([
+            yeo_johnson_lambda(window[:, :-1], start[0], self.width)
+            , yeo_johnson_lambda(window[:, -1], start[1], self.width)
+        ])
+        self.previous[asset] = lambdas
+        self.cache[(asset, key)] = lambdas
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return lambdas
+
+    def observation(self, base: pd.DataFrame, asset: str = 'btcusd') -> np.ndarray:
+        '''
+        Observation of a date indexed window, as get_observation_v2()
+        '''
+        window = base[OBSERVATION_FIELDS].to_numpy(dtype=np.float64)
+        lambdas = self.lambdas(asset, (base.index[-1], len(base)), window)
+        scaled = normalize_windows(window[None], lambdas[None])[0]
+        return scaled.reshape(params.observation_shape).astype('float32')
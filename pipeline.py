@@ -0,0 +1,204 @@
+from db import DBManager, Asset, MANAGER_ERROR, AssetStatus
+from dtypes import asset_column
+from indicators import IndicatorState
+from bitfinex import load_ticks_to_now
+from utils import process_ticks, compute_latest_stats, generate_timesteps_from_ticks, params
+
+from concurrent.futures import Executor, as_completed
+from typing import NamedTuple, List, Dict, Tuple
+from datetime import datetime
+import pandas as pd
+import pendulum
+import logging
+
+# 34,000 is enough to recalculate the longest moving average (700 days)
+STATS_HISTORY_LENGTH: int = 34000
+
+
+class AssetTask(NamedTuple):
+    '''
+    Everything a worker needs for one asset, read up front by the
+    DB owning process so workers never touch the database
+    '''
+    asset: Asset
+    start_date: int
+    end_date: int
+    prev_tick: pd.DataFrame
+    latest_timestep_ts: datetime
+    pending_ticks: pd.DataFrame
+    state: IndicatorState
+    history: pd.DataFrame
+    timeout: int = None
+
+
+class AssetResult(NamedTuple):
+    asset: Asset
+    ticks: pd.DataFrame
+    timesteps: pd.DataFrame
+    state: IndicatorState
+
+
+def state_is_current(state: IndicatorState, latest_timestep_ts: datetime) -> bool:
+    '''
+    A checkpointed indicator state can continue from the last timestep
+    '''
+    return (
+        state is not None
+        and state.last_date == pd.Timestamp(latest_timestep_ts)
+        and state.sma_list == params.smas and state.vol_list == params.vols
+    )
+
+
+def timesteps_with_stats(
+    ticks: pd.DataFrame
+    , asset: Asset
+    , latest_timestep_ts: datetime
+    , state: IndicatorState = None
+    , history: pd.DataFrame = None
+) -> Tuple[pd.DataFrame, IndicatorState]:
+    '''
+    Whole 30-minute timesteps of the ticks after the last timestep with their
+    stats. Incremental from `state` if it is current, otherwise recomputed
+    from `history` (recent timesteps) and the state re-seeded.
+    Returns (None, state) if there are too few ticks or no usable history
+    '''
+    # Only generate timesteps if #ticks > 2 timesteps (current plus subsequent)
+    if ticks is None or len(ticks) < 60:
+        return None, state
+    # Truncate to multiples of 30 (avoid partial timesteps with less than 30 ticks)
+    tail_index: int = -1 * (len(ticks) % 30)
+    target_ticks = ticks if tail_index >= 0 else ticks[:tail_index]
+    new_timesteps = generate_timesteps_from_ticks(target_ticks)
+    new_timesteps['asset'] = asset_column(asset, len(new_timesteps))
+    logging.info(f"{asset.value} | Created {len(new_timesteps)} timesteps from {new_timesteps.index[0]} to {new_timesteps.index[-1]}")
+    if state_is_current(state, latest_timestep_ts):
+        logging.info(f"{asset.value} | Restored indicator state as of {state.last_date}")
+        return state.update_frame(new_timesteps), state
+    if history is None or history.empty:
+        logging.error(f"{asset.value} | No timestep history to compute stats")
+        return None, state
+    new_timesteps = compute_latest_stats(new_timesteps, history, latest_timestep_ts)
+    new_timesteps = new_timesteps[new_timesteps.index > latest_timestep_ts]
+    state = IndicatorState.from_timesteps(
+        asset.value
+        , pd.concat([history, new_timesteps])
+        , params.smas
+        , params.vols
+    )
+    return new_timesteps, state
+
+
+def run_asset_pipeline(task: AssetTask) -> AssetResult:
+    '''
+    fetch -> process_ticks -> generate_timesteps -> stats for one asset.
+    Runs in a worker process, the caller persists the result
+    '''
+    asset: Asset = task.asset
+    ticks: pd.DataFrame = None
+    success, candles = load_ticks_to_now(
+        task.start_date
+        , task.end_date
+        , symbol=asset.value
+        , timeout=task.timeout
+    )
+    if success and candles:
+        logging.info(f"{asset.value} | Processing {len(candles)} ticks")
+        ticks = process_ticks(candles, asset=asset.value, prev_tick=task.prev_tick)
+    pending = [df for df in (task.pending_ticks, ticks) if df is not None and len(df)]
+    timesteps, state = None, task.state
+    if pending:
+        all_ticks = pd.concat(pending)
+        all_ticks = all_ticks[~all_ticks.index.duplicated(keep='first')].sort_index()
+        timesteps, state = timesteps_with_stats(
+            all_ticks
+            , asset
+            , task.latest_timestep_ts
+            , task.state
+            , task.history
+        )
+    return AssetResult(asset, ticks, timesteps, state)
+
+
+def prepare_tasks(
+    manager: DBManager
+    , assets: List[Asset]
+    , end_date: int = None
+    , timeout: int = None
+) -> List[AssetTask]:
+    '''
+    Read the latest status, pending ticks, indicator state and (if the state
+    is stale) timestep history of every asset that has ticks
+    '''
+    end_date = end_date or pendulum.now().int_timestamp * 1000
+    tasks: List[AssetTask] = []
+    status: Dict[Asset, AssetStatus] = {}
+    msg, status = manager.get_latest_status(assets)
+    if msg != MANAGER_ERROR.SUCCESS:
+        return tasks
+    for asset in assets:
+        latest_tick_ts, latest_timestep_ts, prev_tick = status[asset]
+        if prev_tick is None:
+            logging.info(f"{asset.value} | No ticks saved, backfill first. Skipping")
+            continue
+        msg, pending_ticks = manager.get_ticks_after_last_timestep(latest_timestep_ts, asset)
+        msg, state = manager.load_indicator_state(asset)
+        history: pd.DataFrame = None
+        if not state_is_current(state, latest_timestep_ts):
+            state = None
+            msg, history = manager.get_recent_timesteps(STATS_HISTORY_LENGTH, asset)
+        tasks.append(AssetTask(
+            asset=asset
+            , start_date=int(latest_tick_ts.timestamp() * 1000)
+            , end_date=end_date
+            , prev_tick=prev_tick.to_df()
+            , latest_timestep_ts=latest_timestep_ts
+            , pending_ticks=pending_ticks
+            , state=state
+            , history=history
+            , timeout=timeout
+        ))
+    return tasks
+
+
+def persist_result(manager: DBManager, result: AssetResult) -> Tuple[MANAGER_ERROR, int, int]:
+    '''
+    Single writer: ticks, then timesteps, then the indicator checkpoint.
+    Returns: status, #ticks, #timesteps
+    '''
+    tick_count, timestep_count = 0, 0
+    msg, tick_count = manager.append_ticks(result.ticks, result.asset)
+    if msg != MANAGER_ERROR.SUCCESS:
+        return msg, tick_count, timestep_count
+    if result.timesteps is not None and len(result.timesteps):
+        msg, timestep_count = manager.append_timesteps(result.timesteps, result.asset)
+        if msg == MANAGER_ERROR.SUCCESS:
+            manager.save_indicator_state(result.state)
+    return msg, tick_count, timestep_count
+
+
+def run_pipeline(
+    manager: DBManager
+    , executor: Executor
+    , assets: List[Asset] = None
+    , end_date: int = None
+    , timeout: int = None
+) -> Dict[Asset, Tuple[MANAGER_ERROR, int, int]]:
+    '''
+    Run every asset's pipeline (all assets by default) concurrently on
+    `executor` (a process pool) and persist results from this process as
+    they complete
+    '''
+    assets = list(Asset) if assets is None else assets
+    results: Dict[Asset, Tuple[MANAGER_ERROR, int, int]] = {}
+    tasks = prepare_tasks(manager, assets, end_date=end_date, timeout=timeout)
+    futures = {executor.submit(run_asset_pipeline, task): task.asset for task in tasks}
+    for future in as_completed(futures):
+        asset = futures[future]
+        try:
+            results[asset] = persist_result(manager, future.result())
+        except Exception as e:
+            results[asset] = MANAGER_ERROR.ERROR, 0, 0
+            logging.error(f"{asset.value} | Pipeline failed: {e}")
+            logging.exception(e)
+        logging.info(f"{asset.value} | status, ticks, timesteps: {results[asset]}")
+    return results
@@ -0,0 +1,77 @@
+import numpy as np
+
+from typing import Dict
+
+
+class RingBuffer():
+    '''
+    Fixed capacity columnar ring buffer of date-ordered rows.
+    Columns are NumPy arrays keyed by name, 'date' is int64 epoch ns.
+    Appending beyond capacity overwrites the oldest rows.
+    '''
+
+    def __init__(self, capacity: int, columns: Dict[str, np.dtype]) -> None:
+        self.capacity = capacity
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self.start = 0
+        self.size = 0
+
+    @classmethod
+    def from_arrays(cls, capacity: int, arrays: Dict[str, np.ndarray]) -> "RingBuffer":
+        buffer = cls(capacity, {name: a.dtype for name, a in arrays.items()})
+        buffer.extend(arrays)
+        return buffer
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def last_date(self) -> int:
+        '''
+        Most recent date (epoch ns) or None if empty
+        '''
+        if self.size == 0:
+            return None
+        return int(self.arrays['date'][(self.start + self.size - 1) % self.capacity])
+
+    def extend(self, arrays: Dict[str, np.ndarray]) -> int:
+        '''
+        Append rows in ascending date order. Rows not newer than
+        the current tip are ignored, mirroring an insert that skips
+        existing keys. Returns the number of rows appended
+        '''
+        dates = arrays['date']
+        if self.size and len(dates):
+            keep = dates > self.last_date
+            arrays = {name: a[keep] for name, a in arrays.items()}
+        count = len(arrays['date'])
+        if count == 0:
+            return 0
+        if count >= self.capacity:
+            # Only the tail survives
+            for name, a in self.arrays.items():
+                a[:] = arrays[name][-self.capacity:]
+            self.start, self.size = 0, self.capacity
+            return count
+        end = (self.start + self.size) % self.capacity
+        positions = (end + np.arange(count)) % self.capacity
+        for name, a in self.arrays.items():
+            a[positions] = arrays[name]
+        overflow = max(self.size + count - self.capacity, 0)
+        self.start = (self.start + overflow) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+        return count
+
+    def last(self, n: int) -> Dict[str, np.ndarray]:
+        '''
+        The latest `n` rows in ascending date order.
+        Always a copy so later appends cannot mutate a returned frame
+        '''
+        n = min(n, self.size)
+        first = (self.start + self.size - n) % self.capacity
+        if first + n <= self.capacity:
+            return {name: a[first:first + n].copy() for name, a in self.arrays.items()}
+        return {
+            name: np.concatenate((a[first:], a[:first + n - self.capacity]))
+            for name, a in self.arrays.items()
+        }
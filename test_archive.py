@@ -0,0 +1,28 @@
+import pytest
+import pandas as pd
+from datetime import datetime, timezone
+from archive import TickArchive
+
+
+@pytest.fixture
+def ticks():
+    index = pd.date_range(datetime(2024, 1, 31, 23, 55, tzinfo=timezone.utc), periods=10, freq='1min', name='date')
+    return pd.DataFrame({'o': 1.0, 'h': 2.0, 'l': 0.5, 'c': range(10), 'v': 3.0}, index=index)
+
+
+def test_archive_monthly_partitions(tmp_path, ticks):
+    archive = TickArchive(str(tmp_path))
+    count = archive.write('btcusd', ticks)
+    months = archive.months('btcusd')
+    assert count == len(ticks), f"Expected {len(ticks)} ticks written. Got {count}"
+    assert [str(m) for m in months] == ['2024-01', '2024-02'], f"Unexpected partitions {months}"
+
+
+def test_archive_read_range(tmp_path, ticks):
+    archive = TickArchive(str(tmp_path))
+    archive.write('btcusd', ticks)
+    archive.write('btcusd', ticks.iloc[:3]) # rewriting is idempotent
+    df = archive.read('btcusd', ticks.index[3], ticks.index[8])
+    assert len(df) == 5, f"Expected 5 ticks in range. Got {len(df)}"
+    assert (df.index == ticks.index[3:8]).all(), f"Dates don't match {df.index}"
+    assert (df['asset'] == 'btcusd').all(), "Asset column missing"
@@ -0,0 +1,104 @@
+import pytest
+import asyncio
+import json
+import time
+
+from aiohttp import web
+from async_bitfinex import TokenBucket, load_ticks_to_now_async, WINDOW_STEP
+
+
+@pytest.fixture(scope='module')
+def recorded_candles():
+    with open('./ticks.json') as f:
+        # Newest first, as the hist endpoint
+        return sorted(json.load(f), key=lambda c: -c[0])
+
+
+async def stub_server(candles, throttle_every: int = 0):
+    '''
+    Local stand-in for the candles endpoint: newest first, start/end/limit
+    honoured, every `throttle_every`-th request answered with a 429
+    '''
+    state = {'requests': 0, 'throttled': 0, 'in_flight': 0, 'max_in_flight': 0}
+
+    async def hist(request):
+        state['requests'] += 1
+        if throttle_every and state['requests'] % throttle_every == 0:
+            state['throttled'] += 1
+            return web.json_response(["error", 11010, "ratelimit: error"], status=429, headers={'Retry-After': '0.01'})
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        await asyncio.sleep(0.01)
+        state['in_flight'] -= 1
+        start, end = int(request.query['start']), int(request.query['end'])
+        limit = int(request.query['limit'])
+        window = [c for c in candles if start <= c[0] <= end][:limit]
+        return web.json_response(window)
+
+    app = web.Application()
+    app.router.add_get('/v2/candles/{key}/hist', hist)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v2", state
+
+
+def test_token_bucket():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+    elapsed = asyncio.run(scenario())
+    assert elapsed >= 0.19, f"5 tokens at 20/s with burst 1 should take >= 0.2s. Took {elapsed}"
+
+
+def test_load_ticks_to_now_async(recorded_candles):
+    start_date = recorded_candles[-1][0]
+    end_date = start_date + 10 * WINDOW_STEP
+    assert recorded_candles[0][0] > end_date, "Recorded candles don't cover the range"
+
+    async def scenario():
+        runner, api_url, state = await stub_server(recorded_candles, throttle_every=4)
+        try:
+            result = await load_ticks_to_now_async(
+                start_date, end_date, 'btcusd'
+                , concurrency=4, limiter=TokenBucket(rate=1000, capacity=4), api_url=api_url
+            )
+        finally:
+            await runner.cleanup()
+        return result, state
+
+    (msg, tick_store), state = asyncio.run(scenario())
+    expected = []
+    d1 = start_date
+    while d1 < end_date:
+        d2 = min(d1 + WINDOW_STEP, end_date)
+        expected.extend([c for c in recorded_candles if d1 <= c[0] <= d2][:1000])
+        d1 = d2 + 60*1000
+    assert msg, "Async load failed"
+    assert state['throttled'] > 0, "Stub never throttled"
+    assert 1 < state['max_in_flight'] <= 4, f"Expected concurrent requests. Max in flight {state['max_in_flight']}"
+    assert tick_store == expected, "Windows not reassembled in order"
+
+
+def test_load_ticks_to_now_async_stops_on_empty(recorded_candles):
+    start_date = recorded_candles[0][0] - WINDOW_STEP//2
+    end_date = recorded_candles[0][0] + 5 * WINDOW_STEP
+
+    async def scenario():
+        runner, api_url, state = await stub_server(recorded_candles)
+        try:
+            return await load_ticks_to_now_async(
+                start_date, end_date, 'btcusd', limiter=TokenBucket(rate=1000, capacity=4), api_url=api_url
+            )
+        finally:
+            await runner.cleanup()
+
+    msg, tick_store = asyncio.run(scenario())
+    assert msg, "Async load failed"
+    assert tick_store and tick_store[0][0] == recorded_candles[0][0], "Expected only the first window"
+    assert max(c[0] for c in tick_store) <= start_date + WINDOW_STEP, "Fetched past the first empty window"
@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+from async_db import AsyncDBManager, to_async_url
+from db import MANAGER_ERROR, Asset, TradeType, Position, Timestep
+from datetime import datetime, timedelta, timezone
+
+
+@pytest.fixture
+def mock_candles():
+    return [[1705679820000, 41009, 40968, 41009, 40968, 0.4049706]
+            ,[1705679760000, 41071, 41009, 41071, 40995, 1.37254331]
+            ,[1705679700000, 41064, 41048, 41064, 41047, 0.25740038]
+    ]
+
+
+def run(manager: AsyncDBManager, coroutine):
+    async def with_schema():
+        await manager.create_schema()
+        try:
+            return await coroutine()
+        finally:
+            await manager.close()
+    return asyncio.run(with_schema())
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:///PRODUCTION.db") == "sqlite+aiosqlite:///PRODUCTION.db"
+    assert to_async_url("sqlite+aiosqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+
+
+def test_async_candles_and_timestamps(tmp_path, mock_candles):
+    manager = AsyncDBManager(db_url=f"sqlite:///{tmp_path}/async.db")
+
+    async def scenario():
+        msg = await manager.append_bitfinex_candles(Asset.btcusd, mock_candles[1:])
+        assert msg == MANAGER_ERROR.SUCCESS, f"Could not commit raw bitfinex candles {msg}"
+        msg = await manager.append_bitfinex_candles(Asset.btcusd, mock_candles)
+        assert msg == MANAGER_ERROR.DUPLICATE, f"Overlapping append should report DUPLICATE {msg}"
+        msg, inserted, skipped = await manager.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+        assert (inserted, skipped) == (1, 2), f"Unexpected upsert counts {inserted}, {skipped}"
+        return await manager.get_latest_timestamp(Asset.btcusd)
+
+    msg, last_tick, last_timestep = run(manager, scenario)
+    assert msg == MANAGER_ERROR.SUCCESS, f"get_latest_timestamp() failed {msg}"
+    assert last_tick == datetime.fromtimestamp(mock_candles[0][0]/1000, timezone.utc), f"Unexpected last tick {last_tick}"
+
+
+def test_async_recent_timesteps(tmp_path):
+    manager = AsyncDBManager(db_url=f"sqlite:///{tmp_path}/async.db")
+    base_date: datetime = datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+
+    async def scenario():
+        async with manager.get_session() as session:
+            for i in range(20):
+                session.add(Timestep(
+                    date=base_date + timedelta(minutes=i*30), asset=Asset.btcusd, c=1000 + i, v=1, hv=1
+                    , s14=1, s50=1, s100=1, s350=1, s700=1, delta=0, probability=0.5
+                ))
+            await session.commit()
+        return await manager.get_recent_timesteps(5, Asset.btcusd)
+
+    msg, timesteps = run(manager, scenario)
+    assert msg == MANAGER_ERROR.SUCCESS, "Failed to recover recent timesteps"
+    assert len(timesteps) == 5, f"Expected 5 timesteps. Got {len(timesteps)}"
+    assert timesteps.index[-1] == base_date + timedelta(minutes=19*30), "Dates on last row don't match"
+
+
+def test_async_trade_and_account(tmp_path):
+    manager = AsyncDBManager(db_url=f"sqlite:///{tmp_path}/async.db")
+
+    async def scenario():
+        msg, trade = await manager.add_trade(datetime.now(), TradeType.BUY, Asset.btcusd, 0.5, 10.0, 30000.0)
+        assert msg == MANAGER_ERROR.SUCCESS and trade.id is not None, f"add_trade() failed: {msg}"
+        position = Position(asset=Asset.ethusd, pnl=0, spent=1, trailing_loss=0, value=1)
+        msg, account = await manager.update_account_and_position(1, 0.5, 1.5, 0, datetime.now(), [position])
+        assert msg == MANAGER_ERROR.SUCCESS, f"update_account_and_position() failed: {msg}"
+        return await manager.get_account_and_position()
+
+    msg, account = run(manager, scenario)
+    assert msg == MANAGER_ERROR.SUCCESS, f"get_account_and_position() failed: {msg}"
+    assert len(account.positions) == 1, f"Expected a single position. Found {len(account.positions)}"
+    assert account.positions[0].asset == Asset.ethusd, f"Expected ETH, found {account.positions[0].asset}"
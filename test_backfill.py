@@ -0,0 +1,70 @@
+import pytest
+import json
+import pandas as pd
+
+from db import DBManager, MANAGER_ERROR, Asset, Tick
+from dtypes import candles_to_array
+from utils import date_range
+from backfill import backfill_ticks
+import backfill
+
+WINDOW: int = 1000*60*1000
+
+
+@pytest.fixture(scope='module')
+def recorded_candles():
+    with open('./ticks.json') as f:
+        return sorted(json.load(f), key=lambda c: -c[0])
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/backfill.db", new_db=True)
+    yield manager
+    manager.close()
+
+
+def fake_iter_candles(candles, calls, fail_after: int = None):
+    def iter_candles(start_date, end_date, symbol, timeout=None, client=None, as_array=False):
+        calls.append(start_date)
+        for n, (d1, d2) in enumerate(date_range(start_date, end_date, WINDOW)):
+            if fail_after is not None and n == fail_after:
+                raise ConnectionError("Connection reset")
+            window = [c for c in candles if d1 <= c[0] <= d2][:1000]
+            yield candles_to_array(window) if as_array else window
+    return iter_candles
+
+
+def test_backfill_resumes_from_cursor(manager, recorded_candles, monkeypatch):
+    start_date = recorded_candles[-1][0]
+    end_date = start_date + 4 * WINDOW
+    calls = []
+    monkeypatch.setattr(backfill, 'iter_candles', fake_iter_candles(recorded_candles, calls, fail_after=2))
+    msg, inserted, cursor = backfill_ticks(manager, Asset.btcusd, start_date, end_date)
+    assert msg == MANAGER_ERROR.ERROR, "Interrupted backfill should report an error"
+    assert inserted > 0, "Windows before the failure should be persisted"
+    msg, saved_cursor = manager.get_backfill_cursor(Asset.btcusd)
+    assert pd.Timestamp(saved_cursor) == pd.Timestamp(cursor), f"Cursor {saved_cursor} != {cursor}"
+    msg, last_tick = manager.get_last_tick(Asset.btcusd)
+    assert pd.Timestamp(last_tick.date, tz='utc') == pd.Timestamp(cursor), "Cursor is not the last persisted tick"
+
+    monkeypatch.setattr(backfill, 'iter_candles', fake_iter_candles(recorded_candles, calls))
+    msg, resumed, cursor = backfill_ticks(manager, Asset.btcusd, start_date, end_date)
+    assert msg == MANAGER_ERROR.SUCCESS, "Resumed backfill failed"
+    assert calls[-1] == int(saved_cursor.timestamp() * 1000), f"Did not resume from the cursor: {calls}"
+    msg, df = manager.read_frame(Tick, Asset.btcusd)
+    expected_last = max(c[0] for c in recorded_candles if c[0] <= end_date)
+    assert df.index[0] == pd.Timestamp(start_date, unit='ms', tz='utc'), f"First tick {df.index[0]}"
+    assert df.index[-1] == pd.Timestamp(expected_last, unit='ms', tz='utc'), f"Last tick {df.index[-1]}"
+    assert (df.index.to_series().diff().dropna() == pd.Timedelta(minutes=1)).all(), "Gaps or duplicates after resume"
+    assert inserted + resumed == len(df), f"Inserted {inserted} + {resumed} != {len(df)} saved"
+
+
+def test_backfill_without_cursor_starts_at_last_tick(manager, recorded_candles, monkeypatch):
+    first = recorded_candles[-1]
+    manager.upsert_bitfinex_candles(Asset.btcusd, [first])
+    calls = []
+    monkeypatch.setattr(backfill, 'iter_candles', fake_iter_candles(recorded_candles, calls))
+    msg, inserted, cursor = backfill_ticks(manager, Asset.btcusd, end_date=first[0] + WINDOW)
+    assert msg == MANAGER_ERROR.SUCCESS, "Backfill failed"
+    assert calls == [first[0]], f"Expected to start at the last saved tick: {calls}"
@@ -1,6 +1,11 @@
 import pytest
 import requests_mock
-from bitfinex import get_candles, load_ticks_to_now
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dtypes import CANDLE_DTYPE
+from bitfinex import BitfinexClient, RateLimiter, decode_candles, iter_candles, get_rate_limiter, get_candles, get_client, load_ticks_to_now, load_ticks_to_interval
 
 @pytest.fixture
 def bitfinex_api_mock():
@@ -1062,3 +1067,145 @@ def btcusd_long_ticks():
     , [1704130980000, 42773, 42781, 42782, 42773, 0.12606235]
     , [1704130920000, 42774, 42780, 42780, 42774, 0.08189857]
 ]
+
+
+@pytest.fixture
+def local_candles_server(btcusd_ticks):
+    ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            ports.append(self.client_address[1])
+            body = json.dumps(btcusd_ticks).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v2", ports
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_reuses_connection(local_candles_server, btcusd_ticks):
+    api_url, ports = local_candles_server
+    with BitfinexClient(api_url=api_url, timeout=(1, 2)) as client:
+        for _ in range(3):
+            assert get_candles('btcusd', 0, 1, client=client) == btcusd_ticks, "Unexpected candles"
+        assert client.session.headers['Accept-Encoding'].startswith('gzip'), "Compressed transfer not requested"
+    assert len(ports) == 3, f"Expected 3 requests. Got {len(ports)}"
+    assert len(set(ports)) == 1, f"Expected one pooled connection. Got {len(set(ports))}"
+
+
+def test_shared_client():
+    assert get_client() is get_client(), "Expected one shared client per process"
+
+
+@pytest.fixture
+def multi_symbol_server(btcusd_ticks):
+    '''
+    Slow candles endpoint, every symbol but tFAILUSD answers btcusd_ticks
+    '''
+    state = {'in_flight': 0, 'max_in_flight': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with lock:
+                state['in_flight'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+            time.sleep(0.2)
+            with lock:
+                state['in_flight'] -= 1
+            status = 500 if 'tFAILUSD' in self.path else 200
+            body = json.dumps(btcusd_ticks if status == 200 else ["error", 10020, "error"]).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v2", state
+    server.shutdown()
+    server.server_close()
+
+
+def test_load_ticks_to_interval(multi_symbol_server, btcusd_ticks):
+    api_url, state = multi_symbol_server
+    symbols = ['btcusd', 'ethusd', 'failusd', 'ltcusd']
+    start = time.monotonic()
+    with BitfinexClient(api_url=api_url, retries=0, timeout=(1, 2)) as client:
+        msg, tick_store = load_ticks_to_interval(
+            0
+            , 1
+            , symbols=symbols
+            , client=client
+            , limiter=RateLimiter(rate=100, capacity=len(symbols))
+        )
+    elapsed = time.monotonic() - start
+    assert msg == {'btcusd': True, 'ethusd': True, 'failusd': False, 'ltcusd': True}, f"Unexpected status {msg}"
+    for symbol in ['btcusd', 'ethusd', 'ltcusd']:
+        assert tick_store[symbol] == btcusd_ticks, f"Unexpected candles for {symbol}"
+    assert tick_store['failusd'] == [], "Failed symbol should have no candles"
+    assert state['max_in_flight'] > 1, "Symbols were not fetched in parallel"
+    assert elapsed < 0.6, f"4 symbols at 0.2s each should overlap. Took {elapsed}"
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=20, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    assert elapsed >= 0.19, f"5 requests at 20/s with burst 1 should take >= 0.2s. Took {elapsed}"
+
+
+def test_iter_candles_shares_rate_limiter(bitfinex_api_mock, monkeypatch):
+    reserved = []
+    limiter = get_rate_limiter()
+    monkeypatch.setattr(limiter, 'reserve', lambda: reserved.append(1) or 0.0)
+    start_date = 1504541580000
+    end_date = start_date + 4 * 1000*60*1000
+    started = time.monotonic()
+    windows = list(iter_candles(start_date, end_date, 'btcusd', adapter=bitfinex_api_mock))
+    assert len(windows) == 4, f"Expected 4 windows. Got {len(windows)}"
+    assert len(reserved) == 4, f"Every request should draw on the shared budget. Got {len(reserved)}"
+    assert time.monotonic() - started < 1, "iter_candles should not sleep between windows"
+
+
+def test_decode_candles(btcusd_long_ticks):
+    candles = decode_candles(json.dumps(btcusd_long_ticks).encode())
+    assert candles.dtype == CANDLE_DTYPE, f"Unexpected dtype {candles.dtype}"
+    assert candles.tolist() == [tuple(c) for c in btcusd_long_ticks], "Decoded candles differ from json"
+    assert len(decode_candles(b'[]')) == 0, "Empty response should decode to an empty array"
+    with pytest.raises(ValueError):
+        decode_candles(b'["error",10020,"limit: invalid"]')
+
+
+def test_get_candles_as_array(local_candles_server, btcusd_ticks):
+    api_url, ports = local_candles_server
+    with BitfinexClient(api_url=api_url, timeout=(1, 2)) as client:
+        candles = get_candles('btcusd', 0, 1, client=client, as_array=True)
+    assert candles.dtype == CANDLE_DTYPE, f"Unexpected dtype {candles.dtype}"
+    assert candles['ts'].tolist() == [c[0] for c in btcusd_ticks], "Unexpected timestamps"
+    assert candles['v'].tolist() == [c[5] for c in btcusd_ticks], "Unexpected volumes"
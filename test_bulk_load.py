@@ -0,0 +1,44 @@
+import os
+import pytest
+from sqlmodel import SQLModel
+from db import DBManager, MANAGER_ERROR, Asset, Tick, candles_to_rows
+from bulk_load import BulkLoader, ExecutemanyBulkLoader, PostgresCopyBulkLoader, get_bulk_loader
+
+# e.g. postgresql+psycopg://postgres:@/postgres?host=/tmp/pgdata
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+
+@pytest.fixture
+def mock_candles():
+    return [[1705679280000 + i*60000, 40965 + i, 41078, 41078, 40965, 0.8] for i in range(100)]
+
+
+def test_get_bulk_loader():
+    assert isinstance(get_bulk_loader('sqlite'), ExecutemanyBulkLoader)
+    assert isinstance(get_bulk_loader('postgresql'), PostgresCopyBulkLoader)
+    with pytest.raises(TypeError):
+        BulkLoader()
+
+
+def test_executemany_bulk_loader(mock_candles):
+    manager = DBManager(new_db=True)
+    with manager.engine.begin() as conn:
+        inserted = manager.bulk_loader.load(conn, Tick, candles_to_rows(Asset.btcusd, mock_candles))
+    with manager.engine.begin() as conn:
+        reinserted = manager.bulk_loader.load(conn, Tick, candles_to_rows(Asset.btcusd, mock_candles))
+    assert inserted == len(mock_candles), f"Expected {len(mock_candles)} inserted. Got {inserted}"
+    assert reinserted == 0, f"Existing keys should be skipped. Got {reinserted}"
+
+
+@pytest.mark.skipif(POSTGRES_URL is None, reason="TEST_POSTGRES_URL not set")
+def test_postgres_copy_bulk_loader(mock_candles):
+    manager = DBManager(db_url=POSTGRES_URL)
+    SQLModel.metadata.drop_all(manager.engine)
+    manager.create_schema()
+    msg, inserted, skipped = manager.upsert_bitfinex_candles(Asset.btcusd, mock_candles[:60])
+    assert (msg, inserted, skipped) == (MANAGER_ERROR.SUCCESS, 60, 0), f"COPY load failed {msg}, {inserted}, {skipped}"
+    msg, inserted, skipped = manager.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+    assert (inserted, skipped) == (40, 60), f"ON CONFLICT merge failed {inserted}, {skipped}"
+    msg, df = manager.read_frame(Tick, Asset.btcusd)
+    assert len(df) == len(mock_candles), f"Expected {len(mock_candles)} ticks. Got {len(df)}"
+    manager.close()
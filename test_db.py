@@ -1,8 +1,16 @@
 import pytest
+import numpy as np
+import pandas as pd
 
 from sqlmodel import Session, SQLModel, select, create_engine, inspect
+from sqlalchemy import event, delete
 from db import DBManager, ENVIRONMENT, MANAGER_ERROR, Trade, Account
 from db import Tick, Timestep, Asset, TradeType, Position
+from db import DB_CONNECT_PROFILE, ASSET_DTYPE, get_connect_profile
+from db import candles_to_rows
+from dtypes import CANDLE_DTYPE, candles_to_array
+from archive import TickArchive
+from indicators import IndicatorState
 from datetime import datetime, timedelta, timezone
 from typing import List, Tuple
 
@@ -72,11 +80,35 @@ def mock_timestep_btc(session):
             , s700=7000 + i
             , asset=Asset.btcusd
             , delta=8000
+            , probability=0.5
         )
         session.add(timestep)
     session.commit()
     return base_date, last_date
 
+@pytest.fixture
+def mock_timestep_btc_cached():
+    manager: DBManager = DBManager(new_db=True, timestep_cache_size=50)
+    base_date: datetime = datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)
+    with manager.get_session() as session:
+        for i in range(101):
+            session.add(Timestep(
+                date=base_date + timedelta(minutes=i*30)
+                , c=1000 + i
+                , v=10000 + i
+                , hv=2000 + i
+                , s14=3000 + i
+                , s50=4000 + i
+                , s100=5000 + i
+                , s350=6000 + i
+                , s700=7000 + i
+                , asset=Asset.btcusd
+                , delta=8000
+                , probability=0.5
+            ))
+        session.commit()
+    return manager, base_date
+
 @pytest.fixture
 def mock_candles():
     return [[1705679820000, 41009, 40968, 41009, 40968, 0.4049706]
@@ -206,6 +238,19 @@ def test_candles_to_ticks(db_manager_with_schema, mock_candles):
     ticks: List[Tick] = db_manager_with_schema.candles_to_ticks(Asset.btcusd, mock_candles)
     assert len(ticks) == len(mock_candles), f"Could not convert raw bitfinex candles"
 
+def test_candles_to_rows_from_array(db_manager_with_schema, mock_candles):
+    candles = candles_to_array(mock_candles)
+    assert candles.dtype == CANDLE_DTYPE, f"Unexpected dtype {candles.dtype}"
+    assert candles['ts'].tolist() == [c[0] for c in mock_candles], "Timestamps changed"
+    rows = candles_to_rows(Asset.btcusd, candles)
+    assert rows == candles_to_rows(Asset.btcusd, mock_candles), "Array rows differ from list rows"
+    ticks: List[Tick] = db_manager_with_schema.candles_to_ticks(Asset.btcusd, candles)
+    assert [t.date for t in ticks] == [r['date'] for r in rows], "Array ticks differ from list ticks"
+    msg, inserted, skipped = db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, candles)
+    assert msg == MANAGER_ERROR.SUCCESS and inserted == len(mock_candles), f"Could not upsert array candles {msg} {inserted}"
+    msg, inserted, skipped = db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, None)
+    assert (msg, inserted, skipped) == (MANAGER_ERROR.SUCCESS, 0, 0), f"No candles should be a no-op. Got {msg} {inserted}"
+
 def test_append_bitfinex_candles(db_manager_with_schema, mock_candles):
     msg: MANAGER_ERROR = db_manager_with_schema.append_bitfinex_candles(Asset.btcusd, mock_candles)
     assert msg == MANAGER_ERROR.SUCCESS, f"Could not commit raw bitfinex candles {msg}"
@@ -263,4 +308,193 @@ def test_get_recent_timesteps(db_manager_with_schema, mock_timestep_btc):
     assert msg == MANAGER_ERROR.SUCCESS, "Failed to recover recent timesteps"
     assert timesteps.index[0] == mock_timestep_btc[0], "Dates on first row don't match"
     assert timesteps.index[-1] == mock_timestep_btc[1], "Dates on last row don't match"
-    
\ No newline at end of file
+    
+def test_upsert_bitfinex_candles(db_manager_with_schema, mock_candles):
+    msg, inserted, skipped = db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+    assert msg == MANAGER_ERROR.SUCCESS, f"Could not upsert raw bitfinex candles {msg}"
+    assert inserted == len(mock_candles), f"Expected {len(mock_candles)} inserted. Got {inserted}"
+    assert skipped == 0, f"Expected no skipped candles. Got {skipped}"
+
+def test_upsert_bitfinex_candles_overlap(db_manager_with_schema, mock_candles):
+    db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, mock_candles[:10])
+    msg, inserted, skipped = db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+    assert msg == MANAGER_ERROR.SUCCESS, f"Overlapping candles should not fail the batch {msg}"
+    assert inserted == len(mock_candles) - 10, f"Expected {len(mock_candles) - 10} inserted. Got {inserted}"
+    assert skipped == 10, f"Expected 10 skipped candles. Got {skipped}"
+    with db_manager_with_schema.get_session() as session:
+        count = len(session.exec(select(Tick).where(Tick.asset == Asset.btcusd)).all())
+    assert count == len(mock_candles), f"Expected {len(mock_candles)} ticks stored. Found {count}"
+
+def test_connection_profile_pragmas(tmp_path):
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/profile.db", profile=ENVIRONMENT.PROD.value)
+    with manager.engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        busy_timeout = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+    manager.close()
+    assert journal_mode.lower() == "wal", f"Expected WAL journal. Got {journal_mode}"
+    assert busy_timeout == DB_CONNECT_PROFILE["PROD"]["pragmas"]["busy_timeout"], f"Unexpected busy_timeout {busy_timeout}"
+    assert synchronous == 1, f"Expected synchronous=NORMAL (1). Got {synchronous}"
+
+def test_connection_profile_default():
+    assert get_connect_profile(None) is DB_CONNECT_PROFILE["DEFAULT"], "Unknown environment should use the DEFAULT profile"
+    assert get_connect_profile(ENVIRONMENT.PROD) is DB_CONNECT_PROFILE["PROD"], "Environment enum should select its profile"
+
+def test_read_frame_arrays(db_manager_with_schema, mock_timestep_btc):
+    msg, arrays = db_manager_with_schema.read_frame_arrays(Timestep, Asset.btcusd, limit=10, latest=True)
+    assert msg == MANAGER_ERROR.SUCCESS, "Failed to read columnar timesteps"
+    assert arrays['date'].dtype == np.int64, f"Dates should be int64 epoch ns. Got {arrays['date'].dtype}"
+    assert arrays['c'].dtype == np.float64, f"Values should be float64. Got {arrays['c'].dtype}"
+    assert len(arrays['date']) == 10, f"Expected 10 rows. Got {len(arrays['date'])}"
+    assert (np.diff(arrays['date']) > 0).all(), "Dates should be in ascending order"
+    assert arrays['date'][-1] == int(mock_timestep_btc[1].timestamp()) * 10**9, "Last date doesn't match"
+    assert arrays['c'][-1] == 1100, f"Last close doesn't match. Got {arrays['c'][-1]}"
+
+def test_read_frame_compact(tmp_path):
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/compact.db", float32=True, new_db=True)
+    index = pd.date_range('2024-01-01', periods=10, freq='1min', tz='utc', name='date')
+    ticks = pd.DataFrame({k: np.arange(10, dtype=np.float64) + 100 for k in ['o', 'h', 'l', 'c', 'v']}, index=index)
+    manager.append_ticks(ticks, Asset.ethusd)
+    msg, df = manager.get_ticks_after_last_timestep(None, Asset.ethusd)
+    assert msg == MANAGER_ERROR.SUCCESS, "Failed to read ticks"
+    assert df['c'].dtype == np.float32, f"Expected float32 values. Got {df['c'].dtype}"
+    assert df['asset'].dtype == ASSET_DTYPE, f"Expected categorical asset. Got {df['asset'].dtype}"
+    assert (df['asset'] == 'ethusd').all(), "Asset values changed"
+    assert (df.index == index).all(), "Dates changed"
+    manager.close()
+
+def test_get_historical_timesteps(db_manager_with_schema, mock_timestep_btc):
+    start: datetime = mock_timestep_btc[0] + timedelta(minutes=30)
+    msg, timesteps = db_manager_with_schema.get_historical_timesteps(start, 5)
+    assert msg == MANAGER_ERROR.SUCCESS, "Failed to recover historical timesteps"
+    assert str(timesteps.index.tz) == 'UTC', f"Index should be tz-aware UTC. Got {timesteps.index.tz}"
+    assert timesteps.index[0] == start, "Dates on first row don't match"
+    assert len(timesteps) == 5, f"Expected 5 timesteps. Got {len(timesteps)}"
+    assert (timesteps['asset'] == Asset.btcusd.value).all(), "Asset column missing"
+
+def test_timestep_cache(mock_timestep_btc_cached):
+    manager, base_date = mock_timestep_btc_cached
+    msg, timesteps = manager.get_recent_timesteps(10)
+    assert msg == MANAGER_ERROR.SUCCESS, "Failed to recover cached timesteps"
+    assert Asset.btcusd in manager.timestep_cache, "Cache not loaded"
+    new_date = timesteps.index[-1] + timedelta(minutes=30)
+    new_timesteps = timesteps.iloc[-1:].copy()
+    new_timesteps.index = pd.DatetimeIndex([new_date], name='date')
+    msg, count = manager.append_timesteps(new_timesteps, Asset.btcusd)
+    assert msg == MANAGER_ERROR.SUCCESS and count == 1, f"append_timesteps() failed {msg}, {count}"
+    assert Asset.btcusd in manager.timestep_cache, "Cache should survive writes through the manager"
+    msg, frame = manager.get_latest_frame(Asset.btcusd, 10)
+    assert len(frame) == 10, f"Expected 10 items. Got {len(frame)}"
+    assert manager.utc_convert(frame[-1].date) == new_date, f"Cached frame missing new timestep {frame[-1].date}"
+
+def test_timestep_cache_reads_without_queries(mock_timestep_btc_cached):
+    manager, base_date = mock_timestep_btc_cached
+    msg, timesteps = manager.get_recent_timesteps(10)
+    statements = []
+    event.listen(manager.engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    for _ in range(3):
+        msg, cached = manager.get_recent_timesteps(10)
+    assert msg == MANAGER_ERROR.SUCCESS and len(cached) == 10, f"Cached read failed {msg}"
+    assert not [s for s in statements if s.lstrip().upper().startswith('SELECT')], f"Cached reads queried the database: {statements}"
+
+
+def test_timestep_cache_only_inserted_rows(mock_timestep_btc_cached, tmp_path):
+    source, base_date = mock_timestep_btc_cached
+    msg, timesteps = source.get_recent_timesteps(20)
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/cache.db", new_db=True, timestep_cache_size=50)
+    manager.append_timesteps(timesteps.iloc[:10], Asset.btcusd)
+    msg, cached = manager.get_recent_timesteps(5)
+    # Another process writes the next timestep, the manager cannot see it
+    external = timesteps.iloc[10:11].copy()
+    external['c'] = -1.0
+    other = create_engine(str(manager.engine.url))
+    external.to_sql(name='timestep', con=other, if_exists='append')
+    other.dispose()
+    # Row 9 exists and row 10 is skipped by the insert, only row 11 is new
+    msg, count = manager.append_timesteps(timesteps.iloc[9:12], Asset.btcusd)
+    assert msg == MANAGER_ERROR.SUCCESS and count == 1, f"append_timesteps() {msg}, {count}"
+    msg, after = manager.get_recent_timesteps(5)
+    msg, stored = manager.read_frame(Timestep, Asset.btcusd, limit=5, latest=True)
+    manager.close()
+    assert (after.index == stored.index).all(), f"Cache diverged from the database {after.index[-1]} vs {stored.index[-1]}"
+    assert (after['c'].to_numpy() == stored['c'].to_numpy()).all(), "Cache holds a row the insert skipped"
+
+
+def test_timestep_cache_external_write(mock_timestep_btc_cached):
+    manager, base_date = mock_timestep_btc_cached
+    msg, timesteps = manager.get_recent_timesteps(10)
+    new_timesteps = timesteps.iloc[-1:].copy()
+    new_timesteps.index = pd.DatetimeIndex([timesteps.index[-1] + timedelta(minutes=30)], name='date')
+    new_timesteps.to_sql(name='timestep', con=manager.engine, if_exists='append')
+    assert Asset.btcusd not in manager.timestep_cache, "Write outside the manager should invalidate the cache"
+    msg, timesteps_after = manager.get_recent_timesteps(10)
+    assert timesteps_after.index[-1] == new_timesteps.index[-1], "Cache not reloaded after external write"
+
+def test_timestep_cache_invalidated_by_table(mock_timestep_btc_cached, mock_candles):
+    manager, base_date = mock_timestep_btc_cached
+    manager.get_recent_timesteps(10)
+    manager.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+    assert Asset.btcusd in manager.timestep_cache, "Writes to other tables should keep the cache"
+    with manager.get_session() as session:
+        session.exec(delete(Timestep).where(Timestep.date == base_date))
+        session.commit()
+    assert Asset.btcusd not in manager.timestep_cache, "ORM writes to the timestep table should invalidate the cache"
+
+def test_archive_ticks_and_range(tmp_path, db_manager_with_schema):
+    manager: DBManager = db_manager_with_schema
+    manager.archive = TickArchive(str(tmp_path))
+    start = int(datetime(2024, 1, 31, 23, 50, tzinfo=timezone.utc).timestamp() * 1000)
+    candles = [[start + i*60000, 100 + i, 101 + i, 102 + i, 99 + i, 1.0] for i in range(20)]
+    manager.upsert_bitfinex_candles(Asset.btcusd, candles)
+    msg, moved = manager.archive_ticks(datetime(2024, 2, 15, tzinfo=timezone.utc), Asset.btcusd)
+    assert msg == MANAGER_ERROR.SUCCESS, f"archive_ticks() failed {msg}"
+    assert moved == 10, f"Expected January's 10 ticks archived. Got {moved}"
+    msg, hot = manager.read_frame(Tick, Asset.btcusd)
+    assert len(hot) == 10, f"Expected 10 ticks left in the database. Got {len(hot)}"
+    range_start = datetime(2024, 1, 31, 23, 55, tzinfo=timezone.utc)
+    range_end = datetime(2024, 2, 1, 0, 5, tzinfo=timezone.utc)
+    msg, df = manager.get_ticks_range(range_start, range_end, Asset.btcusd)
+    assert msg == MANAGER_ERROR.SUCCESS, f"get_ticks_range() failed {msg}"
+    assert len(df) == 10, f"Expected 10 stitched ticks. Got {len(df)}"
+    assert df.index.is_monotonic_increasing and df.index[0] == range_start, f"Unexpected stitched range {df.index}"
+
+def test_get_latest_status(db_manager_with_schema, mock_candles, mock_timestep_btc):
+    db_manager_with_schema.upsert_bitfinex_candles(Asset.btcusd, mock_candles)
+    msg, status = db_manager_with_schema.get_latest_status()
+    assert msg == MANAGER_ERROR.SUCCESS, f"get_latest_status() failed {msg}"
+    btc = status[Asset.btcusd]
+    assert btc.last_tick_ts == datetime.fromtimestamp(mock_candles[0][0]/1000, timezone.utc), f"Unexpected last tick time {btc.last_tick_ts}"
+    assert btc.last_tick.c == mock_candles[0][2], f"Unexpected last tick {btc.last_tick}"
+    assert btc.last_timestep_ts == mock_timestep_btc[1], f"Unexpected last timestep time {btc.last_timestep_ts}"
+    assert status[Asset.ethusd] == (None, None, None), f"Expected empty status for ethusd {status[Asset.ethusd]}"
+
+def test_account_snapshot_single_query(db_manager_with_schema, account_and_position):
+    positions: List[Position] = [
+        Position(asset=Asset.btcusd, pnl=0, spent=2, trailing_loss=0, value=2)
+        , Position(asset=Asset.ethusd, pnl=0, spent=3, trailing_loss=0, value=3)
+    ]
+    ts: datetime = datetime.now()
+    msg, account = db_manager_with_schema.save_account_snapshot(2, 5, 7, 0.1, ts, positions)
+    assert msg == MANAGER_ERROR.SUCCESS, f"save_account_snapshot() failed {msg}"
+    assert all(p.id is not None for p in account.positions), "Positions not persisted with the account"
+    statements = []
+    event.listen(db_manager_with_schema.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    msg, latest = db_manager_with_schema.get_account_snapshot()
+    assert msg == MANAGER_ERROR.SUCCESS, f"get_account_snapshot() failed {msg}"
+    assert len(statements) == 1, f"Expected one query for account and positions. Got {len(statements)}"
+    assert latest.date == ts, f"Expected the latest account {ts}. Got {latest.date}"
+    assert sorted(p.spent for p in latest.positions) == [2, 3], f"Unexpected positions {latest.positions}"
+
+def test_indicator_state_checkpoint(db_manager_with_schema, mock_timestep_btc):
+    msg, timesteps = db_manager_with_schema.get_recent_timesteps(101)
+    state = IndicatorState.from_timesteps(Asset.btcusd.value, timesteps, {'s14': 14, 's50': 50}, {'hv': 20})
+    msg = db_manager_with_schema.save_indicator_state(state)
+    assert msg == MANAGER_ERROR.SUCCESS, f"save_indicator_state() failed {msg}"
+    state.update(1101)
+    assert db_manager_with_schema.save_indicator_state(state) == MANAGER_ERROR.SUCCESS, "Checkpoint should be replaced"
+    msg, restored = db_manager_with_schema.load_indicator_state(Asset.btcusd)
+    assert msg == MANAGER_ERROR.SUCCESS and restored is not None, f"load_indicator_state() failed {msg}"
+    assert restored.means == pytest.approx(state.means), f"Restored SMAs differ {restored.means}"
+    msg, missing = db_manager_with_schema.load_indicator_state(Asset.ethusd)
+    assert missing is None, "Expected no checkpoint for ethusd"
+    assert db_manager_with_schema.save_indicator_state(None) == MANAGER_ERROR.ERROR, "A missing state should be rejected"
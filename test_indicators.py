@@ -0,0 +1,56 @@
+import pytest
+import statistics
+import numpy as np
+import pandas as pd
+from indicators import RollingMoments, IndicatorState
+from utils import compute_latest_stats
+
+
+@pytest.fixture
+def closes():
+    rng = np.random.default_rng(11)
+    return 40000 + rng.normal(0, 150, 2000).cumsum()
+
+
+def test_rolling_moments_matches_stdev(closes):
+    window = 336
+    state = RollingMoments(window, closes[:window])
+    for i in range(window, len(closes)):
+        expected = statistics.stdev(closes[i - window + 1:i + 1])
+        assert state.peek_std(closes[i]) == pytest.approx(expected, rel=1e-9), f"peek_std mismatch at {i}"
+        state.push(closes[i])
+        assert state.std == pytest.approx(expected, rel=1e-9), f"std mismatch at {i}"
+    assert state.mean == pytest.approx(np.mean(closes[-window:]), rel=1e-12)
+
+
+def test_rolling_moments_partial_window():
+    state = RollingMoments(5, [1.0, 2.0, 4.0])
+    assert len(state) == 3
+    assert state.std == pytest.approx(statistics.stdev([1.0, 2.0, 4.0]))
+    assert state.peek_std(8.0) == pytest.approx(statistics.stdev([1.0, 2.0, 4.0, 8.0]))
+
+
+@pytest.fixture
+def timesteps(closes):
+    index = pd.date_range('2024-01-01', periods=len(closes), freq='30min', tz='utc')
+    series = pd.Series(closes, index=index)
+    return pd.DataFrame({'c': series, 's10': series.rolling(10).mean(), 's50': series.rolling(50).mean()})
+
+
+def test_indicator_state_matches_compute_latest_stats(timesteps):
+    sma_list, vol_list = {'s10': 10, 's50': 50}, {'hv': 24}
+    history, new_timesteps = timesteps[:1900].copy(), timesteps[['c']][1900:].copy()
+    history['hv'] = history['c'].rolling(24).std()
+    history['delta'] = history['c'].pct_change()
+    expected = compute_latest_stats(new_timesteps, history.copy(), sma_list=sma_list, vol_list=vol_list)
+    state = IndicatorState.from_timesteps('btcusd', history, sma_list, vol_list)
+    result = state.update_frame(new_timesteps)
+    assert state.last_date == timesteps.index[-1], f"State not advanced {state.last_date}"
+    assert np.allclose(result[expected.columns].to_numpy(), expected.to_numpy()), "Incremental stats differ from batch stats"
+
+
+def test_indicator_state_round_trip(timesteps):
+    state = IndicatorState.from_timesteps('btcusd', timesteps[:1000], {'s10': 10, 's50': 50}, {'hv': 24})
+    restored = IndicatorState.from_bytes(state.to_bytes())
+    assert restored.last_date == state.last_date and restored.means == state.means, "Checkpoint metadata lost"
+    assert restored.update(40000.0) == pytest.approx(state.update(40000.0)), "Restored state diverges"
@@ -0,0 +1,135 @@
+import pytest
+import asyncio
+import json
+import pandas as pd
+import websockets
+
+from db import DBManager, Asset, Tick
+from live import LiveIngestor, CandleBatcher, candle_key
+import backfill
+
+
+@pytest.fixture(scope='module')
+def recorded_candles():
+    with open('./ticks.json') as f:
+        # Oldest first
+        return sorted(json.load(f), key=lambda c: c[0])
+
+
+def test_candle_batcher():
+    batcher = CandleBatcher()
+    batcher.add(Asset.btcusd, [60000, 1, 1, 1, 1, 1])
+    assert batcher.final(Asset.btcusd) == [], "A forming candle is not final"
+    batcher.add(Asset.btcusd, [60000, 1, 2, 2, 1, 3])
+    batcher.add(Asset.btcusd, [120000, 2, 2, 2, 2, 1])
+    assert batcher.final(Asset.btcusd) == [[60000, 1, 2, 2, 1, 3]], "Last update of a closed minute should win"
+    assert candle_key(Asset.ethusd) == 'trade:1m:tETHUSD'
+
+
+def test_live_ingestion_with_gap_fill(tmp_path, recorded_candles, monkeypatch):
+    C = recorded_candles[:150]
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/live.db", new_db=True)
+    manager.upsert_bitfinex_candles(Asset.btcusd, C[:1])
+    # What the REST endpoint knows, grows once the first connection drops
+    rest = {'candles': C[:1]}
+
+    def iter_candles(start_date, end_date, symbol, timeout=None, client=None, as_array=False):
+        window = [c for c in rest['candles'] if c[0] >= start_date][::-1]
+        if window:
+            yield window
+
+    monkeypatch.setattr(backfill, 'iter_candles', iter_candles)
+    connections = []
+
+    async def replay(ws):
+        '''
+        Local stand-in for the Bitfinex v2 websocket replaying ticks.json
+        '''
+        connections.append(ws)
+        await ws.send(json.dumps({'event': 'info', 'version': 2}))
+        subscribe = json.loads(await ws.recv())
+        assert subscribe == {'event': 'subscribe', 'channel': 'candles', 'key': 'trade:1m:tBTCUSD'}
+        await ws.send(json.dumps({'event': 'subscribed', 'channel': 'candles', 'chanId': 17, 'key': subscribe['key']}))
+        if len(connections) == 1:
+            snapshot, updates = C[0:10], C[10:60]
+        else:
+            snapshot, updates = C[115:125], C[125:150]
+        await ws.send(json.dumps([17, snapshot[::-1]]))
+        for candle in updates:
+            # A provisional update of the minute, then the final one
+            await ws.send(json.dumps([17, [candle[0], candle[1], candle[2] + 1000, candle[3], candle[4], candle[5]]]))
+            await ws.send(json.dumps([17, candle]))
+            await ws.send(json.dumps([17, 'hb']))
+        if len(connections) == 1:
+            rest['candles'] = C[:120]
+            await ws.close()
+        else:
+            await ws.wait_closed()
+
+    async def scenario():
+        stop = asyncio.Event()
+        async with websockets.serve(replay, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            ingestor = LiveIngestor(
+                manager, [Asset.btcusd], url=f"ws://127.0.0.1:{port}", flush_interval=0.05, reconnect_delay=0.05
+            )
+            task = asyncio.ensure_future(ingestor.run(stop))
+            for _ in range(200):
+                await asyncio.sleep(0.05)
+                msg, last = manager.get_last_tick(Asset.btcusd)
+                if last is not None and pd.Timestamp(last.date, tz='utc') >= pd.Timestamp(C[148][0], unit='ms', tz='utc'):
+                    break
+            stop.set()
+            await task
+            ingestor.close()
+
+    asyncio.run(scenario())
+    msg, df = manager.read_frame(Tick, Asset.btcusd)
+    manager.close()
+    assert len(connections) == 2, f"Expected a reconnect. Got {len(connections)} connections"
+    assert df.index[0] == pd.Timestamp(C[0][0], unit='ms', tz='utc'), f"First tick {df.index[0]}"
+    assert df.index[-1] == pd.Timestamp(C[148][0], unit='ms', tz='utc'), f"Forming candle written or ticks missing {df.index[-1]}"
+    assert (df.index.to_series().diff().dropna() == pd.Timedelta(minutes=1)).all(), "Gaps or duplicates in live ticks"
+    recorded = {pd.Timestamp(c[0], unit='ms', tz='utc'): c[2] for c in C}
+    closes = df['c'][df.index.isin(list(recorded))]
+    assert all(closes[ts] == recorded[ts] for ts in closes.index), "Provisional candle updates were persisted"
+
+
+def test_live_ingestion_survives_bad_frame(tmp_path, recorded_candles):
+    C = recorded_candles[:20]
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/live.db", new_db=True)
+    connections = []
+
+    async def replay(ws):
+        connections.append(ws)
+        subscribe = json.loads(await ws.recv())
+        await ws.send(json.dumps({'event': 'subscribed', 'channel': 'candles', 'chanId': 3, 'key': subscribe['key']}))
+        if len(connections) == 1:
+            # Unknown channel key, then a frame that is not JSON
+            await ws.send(json.dumps({'event': 'subscribed', 'channel': 'candles', 'chanId': 4, 'key': 'trade:1m:tXXXUSD'}))
+            await ws.send('not json')
+        await ws.send(json.dumps([3, C[::-1]]))
+        await ws.wait_closed()
+
+    async def scenario():
+        stop = asyncio.Event()
+        async with websockets.serve(replay, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            ingestor = LiveIngestor(
+                manager, [Asset.btcusd], url=f"ws://127.0.0.1:{port}", flush_interval=0.05, reconnect_delay=0.05, gap_fill=False
+            )
+            task = asyncio.ensure_future(ingestor.run(stop))
+            for _ in range(100):
+                await asyncio.sleep(0.05)
+                msg, last = manager.get_last_tick(Asset.btcusd)
+                if last is not None:
+                    break
+            stop.set()
+            await task
+            ingestor.close()
+
+    asyncio.run(scenario())
+    msg, df = manager.read_frame(Tick, Asset.btcusd)
+    manager.close()
+    assert len(connections) == 2, f"Expected a reconnect after the bad frame. Got {len(connections)} connections"
+    assert len(df) == len(C) - 1, f"Expected {len(C) - 1} closed ticks. Got {len(df)}"
@@ -0,0 +1,48 @@
+import sqlite3
+import pytest
+
+from datetime import datetime
+from sqlmodel import select, create_engine, inspect
+from sqlalchemy import MetaData
+from db import DBManager, Timestep, Asset
+from migrate_timestep_probability import migrate, probability_is_nullable
+
+VALUES = dict(c=1., v=1., hv=1., s14=1., s50=1., s100=1., s350=1., s700=1., delta=0.)
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    '''
+    A database created before Timestep.probability became nullable
+    '''
+    db_url = f"sqlite:///{tmp_path}/legacy.db"
+    engine = create_engine(db_url)
+    legacy = MetaData()
+    table = Timestep.__table__.to_metadata(legacy)
+    table.c.probability.nullable = False
+    legacy.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [dict(date=datetime(2024, 1, 1), asset='btcusd', probability=0.5, **VALUES)])
+    yield engine
+    engine.dispose()
+
+
+def test_migrate(legacy_db, tmp_path):
+    backup = f"{tmp_path}/legacy.db.bak"
+    assert not probability_is_nullable(legacy_db)
+    assert migrate(legacy_db, backup), "Legacy schema should be migrated"
+    assert probability_is_nullable(legacy_db), "probability should be nullable after migrate()"
+    indexes = [i['name'] for i in inspect(legacy_db).get_indexes(Timestep.__tablename__)]
+    assert 'ix_timestep_asset_date' in indexes, f"Indexes not recreated: {indexes}"
+    with sqlite3.connect(backup) as conn:
+        assert conn.execute("SELECT probability FROM timestep").fetchall() == [(0.5,)], "Backup is incomplete"
+
+    manager = DBManager(db_url=str(legacy_db.url))
+    with manager.get_session() as session:
+        session.add(Timestep(date=datetime(2024, 1, 1, 0, 30), asset=Asset.btcusd, **VALUES))
+        session.commit()
+        rows = session.exec(select(Timestep).order_by(Timestep.date)).all()
+    manager.close()
+    assert [r.probability for r in rows] == [0.5, None], f"Rows not preserved: {rows}"
+
+    assert not migrate(legacy_db), "A migrated schema should be left untouched"
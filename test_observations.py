@@ -0,0 +1,127 @@
+import pytest
+import pandas as pd
+import numpy as np
+
+from hyperparameters import Params
+from utils import get_observation_v2
+from observations import WindowNormalizer, get_observations, fit_window_lambdas, yeo_johnson, yeo_johnson_lambda, yeo_johnson_bounds, standardize, OBSERVATION_FIELDS
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import stats
+
+params = Params()
+
+
+@pytest.fixture
+def timesteps():
+    rng = np.random.default_rng(7)
+    n = params.observation_size + 6
+    c = 40000 + rng.normal(0, 50, n).cumsum()
+    df = pd.DataFrame({
+        'c': c
+        , 's50': c * 0.99
+        , 's100': c * 0.98
+        , 's350': c * 0.97
+        , 's700': c * 0.96
+        , 'v': rng.gamma(2, 1, n)
+        , 'hv': rng.random(n) * 100
+    }, index=pd.date_range('2024-01-01', periods=n, freq='30T', tz='utc', name='date'))
+    return df
+
+
+def test_yeo_johnson():
+    x = np.array([-3., -0.5, 0., 0.5, 3., 100.])
+    for lmbda in [-1., 0., 0.5, 2., 3.]:
+        assert np.allclose(yeo_johnson(x, lmbda), stats.yeojohnson(x, lmbda)), f"Transform mismatch for lambda {lmbda}"
+
+
+def test_get_observations_parity(timesteps):
+    L = params.observation_size
+    observations = get_observations(timesteps, step=2)
+    expected = np.stack([get_observation_v2(timesteps[k:k + L]) for k in range(0, len(timesteps) - L + 1, 2)])
+    assert observations.shape == (4,) + params.observation_shape, f"Unexpected shape {observations.shape}"
+    assert observations.dtype == np.float32, f"Expected float32, got {observations.dtype}"
+    assert np.allclose(observations, expected, atol=1e-5), f"Max diff {np.abs(observations - expected).max()}"
+
+
+def test_get_observations_parallel(timesteps):
+    serial = get_observations(timesteps)
+    batched = get_observations(timesteps, batch_size=3)
+    assert np.array_equal(serial, batched), "Batching changed the observations"
+    windows = sliding_window_view(timesteps[OBSERVATION_FIELDS].to_numpy(), params.observation_size, axis=0).transpose(0, 2, 1)
+    lambdas = fit_window_lambdas(windows)
+    parallel = fit_window_lambdas(windows, n_jobs=2, chunk_size=2)
+    assert np.array_equal(lambdas, parallel), "Parallel lambda fit changed the lambdas"
+    assert len(get_observations(timesteps[:10])) == 0, "Short frame should have no observations"
+
+
+def test_window_normalizer(timesteps, monkeypatch):
+    L = params.observation_size
+    normalizer = WindowNormalizer()
+    for k in range(3):
+        window = timesteps[k:k + L]
+        expected = get_observation_v2(window)
+        observation = get_observation_v2(window, normalizer=normalizer)
+        assert np.allclose(observation, expected, atol=1e-4), f"Window {k} max diff {np.abs(observation - expected).max()}"
+    assert len(normalizer.cache) == 3, f"Expected 3 cached windows, got {len(normalizer.cache)}"
+    # Repeated window is served from the cache
+    calls = []
+    monkeypatch.setattr('observations.yeo_johnson_lambda', lambda *args: calls.append(args))
+    cached = normalizer.observation(timesteps[2:2 + L])
+    assert not calls, "Cached window was refitted"
+    assert np.array_equal(cached, observation), "Cached observation changed"
+
+
+def test_yeo_johnson_bounds():
+    # Left-skewed windows push scipy's optimum onto its overflow bound, which
+    # yeo_johnson_bounds() mirrors (fails if a scipy upgrade changes the range)
+    x = 1000 - np.random.default_rng(0).exponential(1, 200)
+    lb, ub = yeo_johnson_bounds(x)
+    assert stats.yeojohnson_normmax(x) == pytest.approx(ub), "Positive window should stop at the upper bound"
+    lb, ub = yeo_johnson_bounds(-x)
+    assert stats.yeojohnson_normmax(-x) == pytest.approx(lb), "Negative window should stop at the lower bound"
+
+
+def test_warm_start_chain_parity():
+    # 60-row windows of prices near 40k: the likelihood is rounding noise for
+    # most lambdas, a warm start must still land on PowerTransformer's result
+    rng = np.random.default_rng(0)
+    prices = 40000 + rng.normal(0, 50, 120).cumsum()
+    lmbda = None
+    for k in range(len(prices) - 60 + 1):
+        x = prices[k:k + 60]
+        cold = stats.yeojohnson_normmax(x)
+        lmbda = yeo_johnson_lambda(x, lmbda)
+        expected = standardize(yeo_johnson(x, cold), axis=0)
+        observed = standardize(yeo_johnson(x, lmbda), axis=0)
+        assert np.allclose(observed, expected, atol=1e-6), f"Window {k} drifted: lambda {lmbda} vs {cold}"
+
+
+def test_window_normalizer_chain(timesteps):
+    L = params.observation_size
+    rng = np.random.default_rng(11)
+    n = L + 40
+    c = 40000 + rng.normal(0, 50, n).cumsum()
+    frame = pd.DataFrame({
+        'c': c
+        , 's50': c * 0.99
+        , 's100': c * 0.98
+        , 's350': c * 0.97
+        , 's700': c * 0.96
+        , 'v': rng.gamma(2, 1, n)
+        , 'hv': rng.random(n) * 100
+    }, index=pd.date_range('2024-01-01', periods=n, freq='30T', tz='utc', name='date'))
+    normalizer = WindowNormalizer()
+    for k in range(n - L + 1):
+        window = frame[k:k + L]
+        expected = get_observation_v2(window)
+        observation = normalizer.observation(window)
+        assert np.allclose(observation, expected, atol=1e-5), f"Window {k} max diff {np.abs(observation - expected).max()}"
+
+
+def test_window_normalizer_standard(timesteps):
+    L = params.observation_size
+    observation = WindowNormalizer(mode='standard').observation(timesteps[:L])
+    assert np.allclose(observation, get_observations(timesteps[:L], mode='standard')[0]), "Standard mode mismatch"
+    assert np.allclose(observation.reshape(L, -1).mean(axis=0)[-1], 0, atol=1e-5), "Volume not standardized"
+    with pytest.raises(ValueError):
+        WindowNormalizer(mode='minmax')
@@ -0,0 +1,73 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from db import DBManager, MANAGER_ERROR, Asset
+from indicators import IndicatorState
+from pipeline import run_pipeline, timesteps_with_stats, state_is_current
+import pipeline
+
+SMAS = {'s14': 2, 's50': 3, 's100': 4, 's350': 5, 's700': 6}
+VOLS = {'hv': 7}
+LAST_TIMESTEP = pd.Timestamp('2024-01-02 01:30', tz='utc')
+
+
+def frame(start, periods, freq, base):
+    index = pd.date_range(start, periods=periods, freq=freq, name='date')
+    c = base + np.arange(periods, dtype=np.float64)
+    return pd.DataFrame({'o': c, 'h': c + 1, 'l': c - 1, 'c': c, 'v': np.ones(periods)}, index=index)
+
+
+@pytest.fixture
+def small_params(monkeypatch):
+    monkeypatch.setattr(pipeline.params, 'smas', SMAS)
+    monkeypatch.setattr(pipeline.params, 'vols', VOLS)
+
+
+@pytest.fixture
+def pipeline_manager(tmp_path, small_params):
+    manager = DBManager(db_url=f"sqlite:///{tmp_path}/pipeline.db")
+    manager.create_schema()
+    candles = {}
+    for n, asset in enumerate(Asset):
+        base = 1000 * (n + 1)
+        history = frame(LAST_TIMESTEP - pd.Timedelta(minutes=30 * 49), 50, '30T', base)
+        for key, N in {**SMAS, **VOLS}.items():
+            history[key] = history['c'].rolling(N, min_periods=1).mean()
+        history['delta'] = 0.0
+        manager.append_timesteps(history.drop(columns=['o', 'h', 'l']), asset)
+        state = IndicatorState.from_timesteps(asset.value, history, SMAS, VOLS)
+        manager.save_indicator_state(state)
+        # Ticks of the last timestep are saved, the next 90 minutes are fetched
+        manager.append_ticks(frame(LAST_TIMESTEP, 30, '1T', base), asset)
+        fetched = frame(LAST_TIMESTEP + pd.Timedelta(minutes=30), 90, '1T', base + 30)
+        candles[asset.value] = [
+            [int(ts.timestamp() * 1000), r.o, r.c, r.h, r.l, r.v] for ts, r in fetched.iloc[::-1].iterrows()
+        ]
+    yield manager, candles
+    manager.close()
+
+
+def test_run_pipeline(pipeline_manager, monkeypatch):
+    manager, candles = pipeline_manager
+    monkeypatch.setattr(pipeline, 'load_ticks_to_now', lambda start, end, symbol, timeout=None: (True, candles[symbol]))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = run_pipeline(manager, executor, list(Asset))
+    assert set(results) == set(Asset), f"Missing assets in {results}"
+    for asset in Asset:
+        assert results[asset] == (MANAGER_ERROR.SUCCESS, 90, 3), f"{asset} status, ticks, timesteps: {results[asset]}"
+        msg, state = manager.load_indicator_state(asset)
+        assert state.last_date == LAST_TIMESTEP + pd.Timedelta(minutes=90), f"{asset} state not advanced: {state.last_date}"
+        msg, timesteps = manager.get_recent_timesteps(3, asset)
+        assert timesteps.index[-1] == state.last_date, f"{asset} last timestep {timesteps.index[-1]}"
+        assert not timesteps[list(SMAS)].isna().any().any(), f"{asset} missing stats {timesteps}"
+
+
+def test_timesteps_with_stats_needs_history(small_params):
+    ticks = frame(LAST_TIMESTEP, 90, '1T', 100)
+    timesteps, state = timesteps_with_stats(ticks, Asset.btcusd, LAST_TIMESTEP)
+    assert timesteps is None and state is None, "Stats without state or history"
+    timesteps, state = timesteps_with_stats(ticks[:59], Asset.btcusd, LAST_TIMESTEP)
+    assert timesteps is None, "Expected no timesteps from fewer than 60 ticks"
+    assert not state_is_current(None, LAST_TIMESTEP), "Missing state can't be current"
@@ -0,0 +1,27 @@
+import pytest
+import numpy as np
+from ring_buffer import RingBuffer
+
+
+@pytest.fixture
+def columns():
+    return {'date': np.int64, 'c': np.float64}
+
+
+def test_ring_buffer_wraps(columns):
+    buffer = RingBuffer(5, columns)
+    buffer.extend({'date': np.arange(1, 4), 'c': np.arange(1, 4) * 10.0})
+    buffer.extend({'date': np.arange(4, 8), 'c': np.arange(4, 8) * 10.0})
+    last = buffer.last(5)
+    assert len(buffer) == 5, f"Expected a full buffer. Got {len(buffer)}"
+    assert (last['date'] == np.arange(3, 8)).all(), f"Expected the 5 newest dates. Got {last['date']}"
+    assert (last['c'] == np.arange(3, 8) * 10.0).all(), f"Values out of step with dates {last['c']}"
+    assert buffer.last_date == 7, f"Expected tip 7. Got {buffer.last_date}"
+
+
+def test_ring_buffer_ignores_old_rows(columns):
+    buffer = RingBuffer(5, columns)
+    buffer.extend({'date': np.arange(1, 4), 'c': np.ones(3)})
+    count = buffer.extend({'date': np.arange(2, 6), 'c': np.ones(4) * 2})
+    assert count == 2, f"Only rows after the tip should be appended. Got {count}"
+    assert (buffer.last(10)['date'] == np.arange(1, 6)).all(), "Unexpected dates after overlapping append"
@@ -1,7 +1,10 @@
 import pytest
 import pandas as pd
+import numpy as np
 from datetime import datetime, timezone
-from utils import interval_infill, process_ticks, generate_timesteps_from_ticks, compute_latest_stats
+from indicators import RollingMoments
+from dtypes import candles_to_array
+from utils import interval_infill, process_ticks, process_tick_chunks, generate_timesteps_from_ticks, generate_multi_timesteps, compute_latest_stats, streaming_stats
 
 @pytest.fixture
 def array_of_ticks():
@@ -114,6 +117,45 @@ def test_process_ticks(array_of_ticks, ticks):
     assert (df.all() == ticks[df.columns.to_numpy()].all()).all(), f"Tick conversion to DataFrame failed {df}"
 
 
+def test_process_ticks_compact(array_of_ticks):
+    df = process_ticks(array_of_ticks, asset='btcusd', prev_tick=None, float32=True)
+    assert isinstance(df['asset'].dtype, pd.CategoricalDtype), f"Asset should be categorical. Got {df['asset'].dtype}"
+    assert (df['asset'] == 'btcusd').all(), "Asset values changed"
+    assert (df[['o', 'h', 'l', 'c', 'v']].dtypes == np.float32).all(), f"Expected float32 OHLCV. Got {df.dtypes}"
+    assert df.index[0] == pd.Timestamp(array_of_ticks[0][0], unit='ms', tz='utc'), f"Bad first date {df.index[0]}"
+    timesteps = generate_timesteps_from_ticks(df, interval='5T')
+    assert timesteps['asset'].dtype == df['asset'].dtype, f"Timesteps asset dtype {timesteps['asset'].dtype}"
+    assert timesteps['c'].dtype == np.float32, f"Timesteps should stay float32. Got {timesteps['c'].dtype}"
+    eth = process_ticks(array_of_ticks, asset='ethusd', prev_tick=None)
+    assert eth['c'].dtype == np.float64, "float64 is the default"
+    both = pd.concat([df, eth])
+    assert both['asset'].dtype == df['asset'].dtype, f"Concat of assets fell back to {both['asset'].dtype}"
+
+
+def test_process_ticks_structured_array(array_of_ticks):
+    expected = process_ticks(array_of_ticks, asset='btcusd', prev_tick=None)
+    df = process_ticks(candles_to_array(array_of_ticks), asset='btcusd', prev_tick=None)
+    pd.testing.assert_frame_equal(df, expected)
+    chunks = [candles_to_array(array_of_ticks[:5]), candles_to_array(array_of_ticks[3:])]
+    streamed = pd.concat(list(process_tick_chunks(chunks, 'btcusd')))
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_process_tick_chunks(array_of_ticks):
+    # Gap of 3 minutes across the chunk boundary, overlapping candle, reverse order chunks
+    candles = [c for c in array_of_ticks if c[0] not in (1705679520000, 1705679580000)]
+    chunks = [candles[:4][::-1], candles[3:][::-1]]
+    prev_tick = process_ticks(array_of_ticks[:1], asset='btcusd', prev_tick=None)
+    expected = process_ticks(candles[1:], asset='btcusd', prev_tick=prev_tick.drop(columns=['asset']))
+    frames = list(process_tick_chunks(chunks, 'btcusd', prev_tick=prev_tick.drop(columns=['asset']), max_rows=3))
+    assert all(len(f) <= 3 for f in frames), f"Frames exceed max_rows: {[len(f) for f in frames]}"
+    df = pd.concat(frames)
+    assert df.index.is_unique and df.index.is_monotonic_increasing, f"Chunks overlap {df.index}"
+    assert len(df) == 9, f"Expected 9 infilled ticks after the previous tick. Got {len(df)}"
+    assert np.allclose(df[['o', 'c', 'h', 'l', 'v']], expected[['o', 'c', 'h', 'l', 'v']]), "Chunked result differs"
+    assert list(process_tick_chunks([[], []], 'btcusd')) == [], "Empty chunks should yield nothing"
+
+
 def test_generate_timesteps_from_ticks(ticks):
     df = generate_timesteps_from_ticks(ticks, interval='5T')
     expected = pd.DataFrame(
@@ -128,6 +170,31 @@ def test_generate_timesteps_from_ticks(ticks):
     assert (df.all() == expected.all()).all(), f"Result {df}, doesn't match expected: {expected}"
 
 
+def test_generate_multi_timesteps():
+    rng = np.random.default_rng(3)
+    index = pd.date_range('2024-01-01 00:00', periods=60*24, freq='1T', tz='utc', name='date')
+    c = 40000 + rng.normal(0, 10, len(index)).cumsum()
+    ticks = pd.DataFrame({
+        'o': c + rng.normal(0, 1, len(index))
+        , 'c': c
+        , 'h': c + 5
+        , 'l': c - 5
+        , 'v': rng.random(len(index))
+    }, index=index)
+    ticks['asset'] = 'btcusd'
+    intervals = ['4H', '5T', '1H', '30T', '7T']
+    results = generate_multi_timesteps(ticks, intervals)
+    assert list(sorted(results)) == list(sorted(intervals)), f"Missing intervals {results.keys()}"
+    for interval in intervals:
+        expected = ticks.resample(interval).agg({'o': 'first', 'h': 'max', 'l': 'min', 'c': 'last', 'v': 'sum'})
+        df = results[interval]
+        assert (df.index == expected.index).all(), f"{interval} buckets {df.index} != {expected.index}"
+        assert np.allclose(df[expected.columns].to_numpy(), expected.to_numpy()), f"{interval} OHLCV mismatch"
+        assert (df['asset'] == 'btcusd').all(), f"Asset not kept for {interval}"
+    with pytest.raises(ValueError):
+        generate_multi_timesteps(pd.concat([ticks, ticks.assign(asset='ethusd')]), intervals)
+
+
 def test_compute_latest_stats(ticks_with_stats, ticks):
     current_timesteps = ticks_with_stats[:8].copy()
     new_timesteps = ticks[8:].copy()
@@ -140,3 +207,40 @@ def test_compute_latest_stats(ticks_with_stats, ticks):
     )
     msg = f"Streaming stats incorrect. Expected {ticks_with_stats[8:]}, but got {df_update}"
     assert (ticks_with_stats[8:].all() == df_update.all()).all(), msg
+
+
+def test_interval_infill_multi_day_gap(ticks_with_gaps):
+    ticks_with_gaps = ticks_with_gaps.copy()
+    later = ticks_with_gaps.iloc[-1:].copy()
+    later.index = later.index + pd.Timedelta(days=2, minutes=3)
+    df = interval_infill(pd.concat([ticks_with_gaps, later]), mask_column='infilled')
+    expected = pd.date_range(ticks_with_gaps.index[0], later.index[-1], freq='1min')
+    assert len(df) == len(expected), f"Expected {len(expected)} rows after multi-day infill. Got {len(df)}"
+    assert (df.index == expected).all(), "Date sequence doesn't match"
+    assert df['infilled'].sum() == len(expected) - len(ticks_with_gaps) - 1, "Gap mask doesn't match synthetic rows"
+    assert not df[['o', 'h', 'l', 'c', 'v']].isna().any().any(), "Infill left gaps"
+
+
+def test_compute_latest_stats_matches_streaming_stats():
+    rng = np.random.default_rng(7)
+    index = pd.date_range('2024-01-01', periods=60, freq='30min', tz='utc')
+    closes = pd.Series(40000 + rng.normal(0, 100, len(index)).cumsum(), index=index)
+    history = pd.DataFrame({'c': closes, 's5': closes.rolling(5).mean(), 'hv': closes.rolling(4).std(), 'delta': closes.pct_change()})
+    current_timesteps = history[:40].copy()
+    new_timesteps = history[['c']][40:].copy()
+    df_update = compute_latest_stats(new_timesteps, current_timesteps.copy(), sma_list={'s5': 5}, vol_list={'hv': 4})
+    expected = current_timesteps.copy()
+    for ts, row in new_timesteps.iterrows():
+        expected.loc[ts] = {'c': row['c'], **streaming_stats(expected, row['c'], sma_list={'s5': 5}, vol_list={'hv': 4})}
+    assert len(df_update) == len(new_timesteps), f"Expected {len(new_timesteps)} updated rows. Got {len(df_update)}"
+    assert np.allclose(df_update[expected.columns].to_numpy(), expected[40:].to_numpy()), "Batch stats differ from streaming_stats"
+    with pytest.raises(IndexError):
+        compute_latest_stats(new_timesteps, current_timesteps[-3:].copy(), sma_list={'s5': 2}, vol_list={'hv': 4})
+
+
+def test_streaming_stats_with_vol_state(ticks_with_stats):
+    df = ticks_with_stats[:8]
+    state = RollingMoments(3, df['c'][-3:])
+    expected = streaming_stats(df, 41009, sma_list={'s3': 3}, vol_list={'hv': 3})
+    result = streaming_stats(df, 41009, sma_list={'s3': 3}, vol_list={'hv': 3}, vol_states={'hv': state})
+    assert result['hv'] == pytest.approx(expected['hv']), f"Rolling state hv {result['hv']} != {expected['hv']}"
@@ -7,40 +7,35 @@ import json
 import requests
 
 from datetime import datetime, timedelta, timezone
-from typing import Tuple, List, Any
+from typing import Tuple, List, Any, Dict, Iterable, Iterator, Sequence
+
+from pandas.tseries.frequencies import to_offset
 
 from hyperparameters import Params
+from indicators import RollingMoments
+from observations import WindowNormalizer
+from dtypes import asset_column, CANDLE_FIELDS
 
 params: Params = Params()
 acceptable_response_codes = [200]
 
-def interval_infill(df):
+def interval_infill(df, mask_column: str = None):
     '''
     Fill gaps in the time series with interpolation
     Expect columns: ['ts','o','c','h','l','v']
+    Reindexes once onto a full 1-minute index (gaps of any length,
+    including multi-day outages) and interpolates linearly.
+    mask_column: if set, add a boolean column marking synthetic rows
     '''
-    df['interval'] = df.index.to_series().diff().dt.seconds/60
-    jump_intervals = df[df.interval > 1]
-    merged_df = [df]
-    for index, row in jump_intervals.iterrows():
-        # create a new dataframe with missing timestamps
-        count = int(row['interval'] - 1)
-        #fill = [np.nan for i in range(count)]
-        new_df = pd.DataFrame({
-            'date': pd.date_range(index - pd.Timedelta(row['interval']-1, 'min'), index - pd.Timedelta(1, 'min'), freq='1min')
-            , 'o': np.nan
-            , 'h': np.nan
-            , 'l': np.nan
-            , 'c': np.nan
-            , 'v': np.nan
-        })
-        new_df.set_index('date', inplace=True)
-        merged_df.append(new_df)  
-    merged_df = pd.concat(merged_df)
-    merged_df.sort_index(inplace=True)
-    #logging.debug(f"Merged_df before infill {merged_df}")
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    if len(df) == 0:
+        return df
+    full_index = df.index.union(pd.date_range(df.index[0], df.index[-1], freq='1min'))
+    merged_df = df.reindex(full_index)
+    if mask_column:
+        merged_df[mask_column] = ~full_index.isin(df.index)
     merged_df.interpolate(method='linear', inplace=True)
-    merged_df.drop(columns=['interval'], inplace=True)
+    merged_df.index.name = df.index.name
     return merged_df
 
 
@@ -48,40 +43,137 @@ def process_ticks(
     ticks: List[Any]
     , asset
     , prev_tick
+    , float32: bool = False
 ) -> pd.DataFrame:
     '''
-    Convert tick array to dataframe and infill where necessary.
+    Convert tick array (candle lists or a CANDLE_DTYPE structured array)
+    to dataframe and infill where necessary.
     Generate 30-minute dataframe and return both
     Save to database if engine specified
+    The asset is an ASSET_DTYPE categorical, float32 downcasts OHLCV
     '''
     logging.info(f"Convert tick array to DataFrame. {ticks[:5]} - {ticks[-5:]}")
-    df = pd.DataFrame(ticks, columns=['ts','o','c','h','l','v'])
-    df['date'] = df['ts'].apply(lambda ts: datetime.fromtimestamp(ts/1000, timezone.utc))
-    df.reset_index(drop=True, inplace=True)
-    df.set_index('date', inplace=True)
+    df = pd.DataFrame(ticks, columns=CANDLE_FIELDS)
+    # int64 ms -> ns DatetimeIndex in one step
+    df.index = pd.DatetimeIndex(
+        pd.to_datetime(df.pop('ts').to_numpy(dtype=np.int64), unit='ms', utc=True)
+        , name='date'
+    )
     #pickle_file = f"./process_ticks_before_infill_{df['ts'].iloc[0]}-{df['ts'].iloc[-1]}.p"
     logging.info("Run infill...")
-    df.drop(columns=['ts'], inplace=True)
     df.sort_index(inplace=True) # Ticks from Bitfinex are reverse order. Sort by date first
     df = pd.concat([prev_tick, df]) # Preprend previous tick to ensure no gap to it
     df = interval_infill(df)
-    df.drop(df.index[0], inplace=True) # Remove the prepended previous tick
-    df['asset'] = asset
+    if prev_tick is not None:
+        df.drop(df.index[0], inplace=True) # Remove the prepended previous tick
+    df = df[['o', 'c', 'h', 'l', 'v']].astype(np.float32 if float32 else np.float64)
+    df['asset'] = asset_column(asset, len(df))
     #logging.info(f"Infilled: {df}")
     return df
 
 
+def process_tick_chunks(
+    chunks: Iterable[List[Any]]
+    , asset
+    , prev_tick: pd.DataFrame = None
+    , float32: bool = False
+    , max_rows: int = None
+) -> Iterator[pd.DataFrame]:
+    '''
+    Streaming process_ticks(): consume candle chunks (e.g. one API window each,
+    in ascending time) and yield processed frames. The last tick of each chunk
+    is carried into the next so gaps across chunk boundaries are infilled.
+    Candles not after the carried tick are dropped. With max_rows, frames
+    longer than max_rows (e.g. after infilling a long outage) are split.
+    Peak memory is bounded by the chunk, not the history
+    '''
+    for chunk in chunks:
+        if prev_tick is not None and len(chunk):
+            last_ts = prev_tick.index[-1].value // 10**6
+            if isinstance(chunk, np.ndarray):
+                chunk = chunk[chunk['ts'] > last_ts]
+            else:
+                chunk = [candle for candle in chunk if candle[0] > last_ts]
+        if not len(chunk):
+            continue
+        df = process_ticks(chunk, asset, prev_tick, float32=float32)
+        if df.empty:
+            continue
+        prev_tick = df.iloc[-1:][['o', 'c', 'h', 'l', 'v']]
+        step = max_rows or len(df)
+        for start in range(0, len(df), step):
+            yield df.iloc[start:start + step]
+
+
+def aggregate_ohlcv(
+    ts: np.ndarray
+    , ohlcv: Dict[str, np.ndarray]
+    , step: int
+    , origin: int = 0
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    '''
+    Bucket sorted int64 timestamps (ns) into `step` ns intervals counted
+    from `origin` and aggregate o (first), h (max), l (min), c (last), v (sum).
+    Empty buckets are not emitted
+    '''
+    if len(ts) == 0:
+        return ts, {k: v[:0] for k, v in ohlcv.items()}
+    buckets = ts - (ts - origin) % step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)] - 1
+    return buckets[starts], {
+        'o': ohlcv['o'][starts]
+        , 'h': np.maximum.reduceat(ohlcv['h'], starts)
+        , 'l': np.minimum.reduceat(ohlcv['l'], starts)
+        , 'c': ohlcv['c'][ends]
+        , 'v': np.add.reduceat(ohlcv['v'], starts)
+    }
+
+
+def generate_multi_timesteps(
+    df: pd.DataFrame
+    , intervals: Sequence[str] = ('30T',)
+) -> Dict[str, pd.DataFrame]:
+    '''
+    OHLCV timesteps for several intervals in one pass over the ticks.
+    Only the finest interval reads the ticks; each coarser interval is
+    aggregated from the largest finer interval that divides it
+    (e.g. 5T -> 30T -> 1H -> 4H).
+    The asset is not aggregated: a single-asset frame keeps it as a column
+    '''
+    assets = df['asset'].unique() if 'asset' in df.columns else []
+    if len(assets) > 1:
+        raise ValueError(f"generate_multi_timesteps() expects one asset per frame. Got {list(assets)}")
+    df = df.sort_index()
+    index = pd.DatetimeIndex(df.index)
+    base = (
+        index.values.astype('datetime64[ns]').view(np.int64)
+        # float32 input stays float32
+        , {k: df[k].to_numpy(dtype=np.result_type(df[k].dtype, np.float32)) for k in ('o', 'h', 'l', 'c', 'v')}
+    )
+    # Buckets start at midnight of the first tick, as DataFrame.resample()
+    day = 24*60*60*10**9
+    origin = int(base[0][0] - base[0][0] % day) if len(df) else 0
+    steps = sorted((to_offset(interval).nanos, interval) for interval in intervals)
+    computed: Dict[int, Tuple[np.ndarray, Dict[str, np.ndarray]]] = {}
+    results: Dict[str, pd.DataFrame] = {}
+    for step, interval in steps:
+        finer = [s for s in computed if step % s == 0]
+        source = computed[max(finer)] if finer else base
+        computed[step] = aggregate_ohlcv(source[0], source[1], step, origin)
+        dates, values = computed[step]
+        frame = pd.DataFrame(values, index=pd.DatetimeIndex(dates.view('datetime64[ns]'), name=index.name))
+        if index.tz is not None:
+            frame.index = frame.index.tz_localize('utc').tz_convert(index.tz)
+        if len(assets):
+            frame['asset'] = pd.Series(assets[0], index=frame.index, dtype=df['asset'].dtype)
+        results[interval] = frame
+    return results
+
+
 def generate_timesteps_from_ticks(df: pd.DataFrame, interval: str = '30T') -> pd.DataFrame:
     logging.info(f"Generate timesteps for interval {interval} from {len(df)} ticks")
-    df_interval = df.resample(interval).agg({
-        'o': 'first'
-        , 'h': 'max'
-        , 'l': 'min'
-        , 'c': 'last'
-        , 'v': 'sum'
-        , 'asset': 'last'
-    })
-    return df_interval
+    return generate_multi_timesteps(df, [interval])[interval]
 
 
 #max_holding_period = 1  # days
@@ -97,12 +189,16 @@ def streaming_stats(
     , c_n: float
     , sma_list: dict=params.smas
     , vol_list: dict=params.vols
+    , vol_states: Dict[str, RollingMoments]=None
 ) -> dict:
     '''
         df - main dataframe with current data
         c_n - most recent close value
         sma_list - dict of moving averages durations
         vol_list - dict of volatility durations
+        vol_states - optional RollingMoments per volatility key holding
+            the last N closes of df. Gives hv in constant time instead of
+            a stdev over the window. Push c_n once the row is appended
     '''
     tip_idx = df.index[-1]
     results = {}
@@ -115,7 +211,10 @@ def streaming_stats(
         results[sma_key] = mu_n
     for vol_key in vol_list.keys():
         N = vol_list[vol_key]
-        sigma_n = statistics.stdev(df['c'][1-N:].to_list() + [c_n])
+        if vol_states and vol_key in vol_states:
+            sigma_n = vol_states[vol_key].peek_std(c_n)
+        else:
+            sigma_n = statistics.stdev(df['c'][1-N:].to_list() + [c_n])
         results[vol_key] = sigma_n
     c_prev = df['c'][tip_idx]
     results['delta'] = (c_n - c_prev)/c_prev
@@ -125,22 +224,42 @@ def streaming_stats(
 def compute_latest_stats(
     new_timesteps: pd.DataFrame
     , current_timesteps: pd.DataFrame
-    , latest_timestep_ts: datetime
+    , latest_timestep_ts: datetime = None
     , sma_list: dict=params.smas
     , vol_list: dict=params.vols
 ) -> pd.DataFrame:
-    for row in new_timesteps[new_timesteps.index > latest_timestep_ts].iterrows():
-        row_dict = row[1].to_dict()
-        c_n = row[1]['c']
-        new_stats = streaming_stats(
-            current_timesteps
-            , c_n
-            , sma_list=sma_list
-            , vol_list=vol_list
-        )
-        row_dict.update(new_stats)
-        #end_idx = len(current_timesteps)
-        current_timesteps.loc[row[0]] = row_dict
+    '''
+    Batch equivalent of applying `streaming_stats` row by row.
+    Closes of the history and the new rows are concatenated once:
+        SMA: mu_k = mu_0 + cumsum(c_k - c_(k-N))/N
+        volatility: sample stdev of each trailing N-close window
+        delta: c_k/c_(k-1) - 1
+    latest_timestep_ts: only rows after it are new (default: history tip)
+    '''
+    if latest_timestep_ts is None:
+        latest_timestep_ts = current_timesteps.index[-1]
+    new_rows = new_timesteps[new_timesteps.index > latest_timestep_ts]
+    if len(new_rows):
+        L = len(current_timesteps)
+        closes = np.concatenate((
+            current_timesteps['c'].to_numpy(dtype=np.float64)
+            , new_rows['c'].to_numpy(dtype=np.float64)
+        ))
+        positions = np.arange(L, len(closes))
+        stats = {}
+        for sma_key, N in sma_list.items():
+            if N > L:
+                raise IndexError(f"{sma_key} needs {N} timesteps of history. Got {L}")
+            mu_0 = current_timesteps[sma_key].iloc[-1]
+            stats[sma_key] = mu_0 + np.cumsum(closes[positions] - closes[positions - N])/N
+        for vol_key, N in vol_list.items():
+            if N > L:
+                raise IndexError(f"{vol_key} needs {N} timesteps of history. Got {L}")
+            windows = np.lib.stride_tricks.sliding_window_view(closes[L - N + 1:], N)
+            stats[vol_key] = windows.std(axis=1, ddof=1)
+        stats['delta'] = closes[positions]/closes[positions - 1] - 1
+        new_rows = new_rows.assign(**stats).reindex(columns=current_timesteps.columns)
+        current_timesteps = pd.concat([current_timesteps, new_rows])
     # Return the updated rows only
     return current_timesteps[current_timesteps.index >= new_timesteps.index[0]]
 
@@ -191,12 +310,15 @@ def column_normalize(column, scaler=None):
     return scaled_column
 
 
-def get_observation_v2(base):
+def get_observation_v2(base, normalizer: WindowNormalizer = None, asset: str = 'btcusd'):
     '''
     Get an observation starting at time T, window-normalize volume, reshape into 3D array
     Save the current delta for recalculation of equity if required (assets > 0)
     N = lookback_period_in_T
+    With a normalizer, lambdas are cached/warm-started across calls
     '''
+    if normalizer is not None:
+        return normalizer.observation(base, asset)
     base = base[params.target_fields]
     v_idx = params.target_fields.index('v')
     # scale volume